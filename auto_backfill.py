@@ -16,14 +16,15 @@ from utils import log, log_error
 def is_first_run(db, flag_name="backfill_done"):
     """Return True if DB has posts but no comments, or flag is missing."""
     try:
-        conn = db._get_conn()
-        posts = conn.execute("SELECT COUNT(*) FROM posts;").fetchone()[0]
-        comments = conn.execute("SELECT COUNT(*) FROM comments;").fetchone()[0]
-        flag_row = conn.execute(
-            "SELECT value FROM db_meta WHERE key=?;", (flag_name,)
-        ).fetchone()
-        conn.close()
-        return (posts > 0 and comments == 0) or not flag_row
+        # DB's shared, WAL-mode connection; its lock serializes use across threads
+        with db._lock:
+            # EXISTS stops at the first row instead of counting whole tables
+            has_posts, has_comments, has_flag = db._get_conn().execute(
+                "SELECT EXISTS(SELECT 1 FROM posts), EXISTS(SELECT 1 FROM comments), "
+                "EXISTS(SELECT 1 FROM db_meta WHERE key=?);",
+                (flag_name,),
+            ).fetchone()
+        return bool((has_posts and not has_comments) or not has_flag)
     except Exception as e:
         log_error(f"auto_backfill.is_first_run({flag_name})", e)
         return True
@@ -32,13 +33,11 @@ def is_first_run(db, flag_name="backfill_done"):
 def mark_backfill_complete(db, flag_name="backfill_done"):
     """Mark a backfill as done in db_meta."""
     try:
-        conn = db._get_conn()
-        conn.execute(
-            "INSERT OR REPLACE INTO db_meta (key, value) VALUES (?, 'true');",
-            (flag_name,),
-        )
-        conn.commit()
-        conn.close()
+        with db._lock, db._get_conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO db_meta (key, value) VALUES (?, 'true');",
+                (flag_name,),
+            )
         log(f"✅ Backfill flag '{flag_name}' set successfully.")
     except Exception as e:
         log_error(f"auto_backfill.mark_backfill_complete({flag_name})", e)
@@ -11,28 +11,62 @@ Reddit → Lemmy Auto Mirror (Hybrid, quiet auto-refresh)
 - SQLite + legacy JSON migration retained
 """
 
+import io
 import os
-import re
 import sys
 import json
 import time
 import math
 import html
+import random
 import queue
+import signal
 import errno
+import hashlib
 import sqlite3
 import logging
+import asyncio
 import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 from datetime import datetime, timedelta
 from html import unescape
 
+import aiohttp
 import requests
 
+try:
+    import orjson  # optional: C-level serializer for the hot-path state files
+except ImportError:
+    orjson = None
+
+try:
+    import uvloop  # optional: libuv-backed event loop for the aiohttp fan-out
+except ImportError:
+    uvloop = None
+
+try:
+    from dotenv import dotenv_values  # optional: only needed for the SUB_MAP hot-reload
+except ImportError:
+    dotenv_values = None
+
+def _read_json_file(path):
+    """Parse a JSON file straight from bytes (no str decode copy); orjson when available."""
+    with open(path, "rb") as f:
+        return orjson.loads(f.read()) if orjson is not None else json.load(f)
+
+def _json_body(r):
+    """Decode a requests response from its raw bytes; orjson skips the str decode + stdlib parse."""
+    return orjson.loads(r.content) if orjson is not None else r.json()
+
 from job_queue import JobDB
 from db_cache import DB
 from comment_mirror import mirror_comment_to_lemmy
-from mirror_media import mirror_url
+from mirror_media import mirror_url, flush_cache, fsync_dir, log
+from rate_limiter import get_limiter, backoff_delay, retry_after_secs
+from utils import pooled_adapter, pooled_session
 
 logger = logging.getLogger(__name__)
 
@@ -46,23 +80,42 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 DOTENV_PATH = os.getenv("DOTENV_PATH", "/opt/Reddit-Mirror-2-Lemmy/.env")
 
 LEMMY_URL = os.getenv("LEMMY_URL", "https://fosscad.guncaddesigns.com").rstrip("/")
+# Lemmy endpoints, built once instead of per request
+LEMMY_API_LOGIN = f"{LEMMY_URL}/api/v3/user/login"
+LEMMY_API_POST = f"{LEMMY_URL}/api/v3/post"
+LEMMY_API_COMMENT = f"{LEMMY_URL}/api/v3/comment"
+LEMMY_API_COMMUNITY = f"{LEMMY_URL}/api/v3/community"
+LEMMY_API_COMMUNITY_LIST = f"{LEMMY_URL}/api/v3/community/list"
 LEMMY_USER = os.getenv("LEMMY_USER", "mirrorbot")
 LEMMY_PASS = os.getenv("LEMMY_PASS", "password")
 
 TEST_MODE = os.getenv("TEST_MODE", "false").lower() == "true"
+# fsync for durable JSON writes; SAFE_FSYNC=false keeps only the atomic rename
+SAFE_FSYNC = os.getenv("SAFE_FSYNC", "true").lower() == "true"
 
 ENABLE_MEDIA_PREVIEW = os.getenv("ENABLE_MEDIA_PREVIEW", "true").lower() == "true"
 EMBED_PERMALINK_FOOTER = os.getenv("EMBED_PERMALINK_FOOTER", "true").lower() == "true"
 MAX_GALLERY_IMAGES = int(os.getenv("MAX_GALLERY_IMAGES", "10"))
 
 POST_FETCH_LIMIT = os.getenv("POST_FETCH_LIMIT", "10")  # "10" or "all"
+FETCH_ALL = POST_FETCH_LIMIT.lower() in ("all", "none", "0")
+FETCH_PER_PAGE = 100 if FETCH_ALL else int(POST_FETCH_LIMIT)
 POST_COOLDOWN_SECS = int(os.getenv("POST_COOLDOWN_SECS", "10"))  # space between Lemmy posts
+COMMENT_WORKERS = int(os.getenv("COMMENT_WORKERS", "4"))  # concurrent comment POSTs
+SUBREDDIT_CONCURRENCY = max(1, int(os.getenv("SUBREDDIT_CONCURRENCY", "3")))  # subreddits polled at once
+# /new.json is newest-first, so paging normally stops at the first page holding a known post.
+# Set true to walk all FETCH_ALL pages anyway (e.g. to finish an interrupted backfill).
+PAGINATE_PAST_KNOWN = os.getenv("PAGINATE_PAST_KNOWN", "false").lower() == "true"
 
 TOKEN_FILE = DATA_DIR / "token.json"
 COMMUNITY_MAP_FILE = DATA_DIR / "community_map.json"
+COMMUNITY_META_FILE = DATA_DIR / "community_map.meta.json"  # fetch time + HTTP validators
 POST_MAP_FILE = DATA_DIR / "post_map.json"  # legacy JSON (read for migration only)
 
 TOKEN_REUSE_HOURS = 23
+TOKEN_REUSE_SECS = TOKEN_REUSE_HOURS * 3600
+TOKEN_REFRESH_SKEW = 60  # treat the token as stale this many secs early to avoid expiry-boundary races
+TOKEN_LOG_EVERY_SECS = 3600  # "using cached token" is logged at most this often
 COMMUNITY_REFRESH_HOURS = int(os.getenv("COMMUNITY_REFRESH_HOURS", "6"))
 SLEEP_BETWEEN_CYCLES = int(os.getenv("SLEEP_BETWEEN_CYCLES", "900"))  # 15 min between full cycles
 SUB_MAP_RELOAD_HOURS = int(os.getenv("SUB_MAP_RELOAD_HOURS", str(COMMUNITY_REFRESH_HOURS)))
@@ -81,133 +134,365 @@ def _parse_sub_map(raw: str) -> dict:
 SUB_MAP: dict[str, str] = _parse_sub_map(os.getenv("SUB_MAP", "fosscad2:fosscad2,3d2a:3d2a,FOSSCADtoo:FOSSCADtoo"))
 
 # ─────────────────────────────────────────────
-# LOG SHORTCUT
+# CLOCKS: monotonic for elapsed intervals, wall-clock only for persisted timestamps
 # ─────────────────────────────────────────────
-def log(msg: str):
-    # Console-friendly timestamp + flush
-    from datetime import timezone
-    print(f"{datetime.now(timezone.utc).isoformat()} | {msg}", flush=True)
+_MONO_ORIGIN = time.monotonic() - time.time()
+
+def _age_since(wall_ts: float) -> float:
+    """Seconds since a persisted wall-clock timestamp, measured on the monotonic clock
+    (so an NTP step after startup can't make a fresh token look stale or vice versa)."""
+    return time.monotonic() - (wall_ts + _MONO_ORIGIN)
 
 # ─────────────────────────────────────────────
-# LEGACY POST MAP (for one-time migration)
+# LEMMY HTTP SESSION (keep-alive + pooled connections)
+# ─────────────────────────────────────────────
+LEMMY_USER_AGENT = os.getenv("LEMMY_USER_AGENT", "reddit-lemmy-bridge/1.0")
+
+SESSION = pooled_session(retries=0, pool_maxsize=16)
+# Transient gateway errors are retried only for the Lemmy host itself
+SESSION.mount(LEMMY_URL, pooled_adapter(pool_maxsize=16))
+SESSION.headers["User-Agent"] = LEMMY_USER_AGENT
+
+# Reddit gets its own pool: SESSION carries the Lemmy bearer token, which must
+# never be sent to reddit.com. 429s are handled by the callers (Retry-After).
+REDDIT_SESSION = pooled_session(pool_maxsize=16)
+
+def _set_session_jwt(jwt: str | None):
+    """Attach (or clear) the Bearer token used by every Lemmy call on SESSION."""
+    if jwt:
+        SESSION.headers["Authorization"] = f"Bearer {jwt}"
+    else:
+        SESSION.headers.pop("Authorization", None)
+
+# ─────────────────────────────────────────────
+# ASYNC HTTP (one event loop + aiohttp session per process)
 # ─────────────────────────────────────────────
-if POST_MAP_FILE.exists():
+# asyncio.run() per cycle would tear down the session (and every kept-alive
+# TLS connection to Reddit/Lemmy) each time; reuse one loop instead.
+# Only the main thread drives it, one coroutine at a time.
+_LOOP: "asyncio.AbstractEventLoop | None" = None
+_HTTP: "aiohttp.ClientSession | None" = None
+
+def _run(coro):
+    """Run a coroutine to completion on the process-wide event loop."""
+    global _LOOP
+    if _LOOP is None or _LOOP.is_closed():
+        _LOOP = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
+    return _LOOP.run_until_complete(coro)
+
+async def _http_session() -> "aiohttp.ClientSession":
+    """Long-lived aiohttp session, created lazily on the running loop."""
+    global _HTTP
+    if _HTTP is None or _HTTP.closed:
+        _HTTP = aiohttp.ClientSession(
+            headers={"User-Agent": LEMMY_USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=20),
+            connector=aiohttp.TCPConnector(limit=32, limit_per_host=16, keepalive_timeout=75),
+        )
+    return _HTTP
+
+def close_http():
+    """Close the shared session and loop (call once on shutdown)."""
+    global _HTTP, _LOOP
+    if _LOOP is None or _LOOP.is_closed():
+        return
+    if _HTTP is not None and not _HTTP.closed:
+        _LOOP.run_until_complete(_HTTP.close())
+    _HTTP = None
+    _LOOP.close()
+    _LOOP = None
+
+# Server-advertised budget (X-Ratelimit-* headers), shared by every Lemmy call site
+RATE_HEADROOM = int(os.getenv("RATE_HEADROOM", "5"))
+_rate_state = {"remaining": None, "reset_at": 0.0}
+
+def _note_rate_headers(r):
+    remaining = r.headers.get("X-Ratelimit-Remaining")
+    if remaining is None:
+        return
     try:
-        legacy_post_map = json.loads(POST_MAP_FILE.read_text())
-        log(f"🗂️ (legacy) Loaded {len(legacy_post_map)} posts from {POST_MAP_FILE}")
-    except Exception as e:
-        log(f"⚠️ Failed to read legacy post_map.json: {e}")
-        legacy_post_map = {}
-else:
-    legacy_post_map = {}
-    log("📂 No legacy post_map.json found (fresh start).")
+        _rate_state["remaining"] = int(float(remaining))
+        _rate_state["reset_at"] = time.monotonic() + float(r.headers.get("X-Ratelimit-Reset", "0"))
+    except ValueError:
+        pass
+
+def _rate_budget_ok() -> bool:
+    """True when the server told us it still has plenty of budget left."""
+    remaining = _rate_state["remaining"]
+    return remaining is not None and remaining > RATE_HEADROOM
+
+def _rate_reset_wait() -> float:
+    """Seconds until the advertised window resets (0 if unknown or already reset)."""
+    return max(0.0, _rate_state["reset_at"] - time.monotonic())
+
+def _wait_rate_window():
+    # Quota exhausted: sleep exactly until the window resets
+    if _rate_state["remaining"] == 0:
+        wait = _rate_reset_wait()
+        if wait > 0:
+            log(f"⏳ Lemmy rate budget exhausted — sleeping {wait:.1f}s until reset")
+            time.sleep(wait)
+        _rate_state["remaining"] = None
+
+def _ensure_session_jwt(jwt: str | None):
+    # Callers that were handed a JWT explicitly only seed the session;
+    # a newer token set by lemmy_login() is never overwritten.
+    if jwt and "Authorization" not in SESSION.headers:
+        _set_session_jwt(jwt)
+
+# ─────────────────────────────────────────────
+# LEGACY POST MAP (for one-time migration)
+# ─────────────────────────────────────────────
+_legacy_post_map: dict | None = None
+
+def get_legacy_post_map() -> dict:
+    """Legacy post_map.json, read on first use instead of at import."""
+    global _legacy_post_map
+    if _legacy_post_map is None:
+        _legacy_post_map = {}
+        if POST_MAP_FILE.exists():
+            try:
+                _legacy_post_map = _read_json_file(POST_MAP_FILE)
+                log(f"🗂️ (legacy) Loaded {len(_legacy_post_map)} posts from {POST_MAP_FILE}")
+            except Exception as e:
+                log(f"⚠️ Failed to read legacy post_map.json: {e}")
+        else:
+            log("📂 No legacy post_map.json found (fresh start).")
+    return _legacy_post_map
 
 # ─────────────────────────────────────────────
 # JSON UTIL
 # ─────────────────────────────────────────────
+# path → ((mtime_ns, size), parsed); a file is only re-parsed after it changes on disk
+_json_cache: dict[str, tuple[tuple[int, int], object]] = {}
+
 def load_json(path, default=None):
-    p = Path(path)
-    if not p.exists():
+    """
+    Parsed JSON file, memoized on (mtime, size). The returned object is shared
+    with later calls, so callers must treat it as read-only.
+    """
+    key = str(path)
+    try:
+        st = os.stat(key)
+    except FileNotFoundError:
+        _json_cache.pop(key, None)
         return default if default is not None else {}
+    stamp = (st.st_mtime_ns, st.st_size)
+    hit = _json_cache.get(key)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
     try:
-        with open(p, "r") as f:
-            return json.load(f)
+        data = _read_json_file(key)
     except Exception:
         return default if default is not None else {}
-
-def save_json(path, data):
+    _json_cache[key] = (stamp, data)
+    return data
+
+def _dumps_compact(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+def _dumps_pretty(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode("utf-8")
+
+# Crash-critical state (mappings, failure counters, media cache) goes through the
+# atomic save_json(). Regenerable state (community_map.json) uses
+# save_json_fast(): still tmp + rename, just no fsync (a lost write means one extra refresh).
+# token.json holds a secret, so it gets its own owner-only swap (_save_token_file).
+def save_json(path, data, compact=False, durable=None):
+    """
+    Atomic JSON write. compact=True skips pretty-printing for frequently rewritten files.
+    durable=True does the full fsync(file) → rename → fsync(dir) sequence; hot-path
+    callers pass durable=False (still atomic) and make one durable write at the end.
+    durable=None follows SAFE_FSYNC.
+    """
+    if durable is None:
+        durable = SAFE_FSYNC
     p = Path(path)
     tmp = Path(str(p) + ".tmp")
-    with open(tmp, "w") as f:
-        json.dump(data, f, indent=2)
-        f.flush()
-        os.fsync(f.fileno())
-    tmp.replace(p)
-    
+    payload = _dumps_compact(data) if compact else _dumps_pretty(data)
+    with open(tmp, "wb") as f:
+        f.write(payload)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, p)
+    if durable:
+        fsync_dir(p.parent)
+
+def save_json_fast(path, data):
+    """Atomic tmp + rename without fsync, for regenerable files only; readers never see a torn file."""
+    p = Path(path)
+    tmp = Path(str(p) + ".tmp")
+    tmp.write_bytes(_dumps_compact(data))
+    os.replace(tmp, p)
+
 REDDIT_FAILS_FILE = DATA_DIR / "reddit_fetch_failures.json"
 REDDIT_FAIL_MAX = int(os.getenv("REDDIT_FAIL_MAX", "3"))
+# Bounds on the failure file: entries expire after the TTL (the id gets one
+# more try) and only the newest REDDIT_FAIL_CAPACITY are kept
+REDDIT_FAIL_TTL_SECS = int(os.getenv("REDDIT_FAIL_TTL_DAYS", "30")) * 86400
+REDDIT_FAIL_CAPACITY = int(os.getenv("REDDIT_FAIL_CAPACITY", "50000"))
 
 def _load_reddit_fails():
     try:
         if REDDIT_FAILS_FILE.exists():
-            return json.loads(REDDIT_FAILS_FILE.read_text())
+            return _read_json_file(REDDIT_FAILS_FILE)
     except Exception:
         pass
     return {}
 
+def _prune_reddit_fails(d: dict) -> None:
+    cutoff = time.time() - REDDIT_FAIL_TTL_SECS
+    for rid in [rid for rid, e in d.items() if float(e.get("ts", 0)) < cutoff]:
+        del d[rid]
+    if len(d) > REDDIT_FAIL_CAPACITY:
+        newest = sorted(d.items(), key=lambda kv: float(kv[1].get("ts", 0)), reverse=True)
+        d.clear()
+        d.update(newest[:REDDIT_FAIL_CAPACITY])
+
 def _save_reddit_fails(d):
+    _prune_reddit_fails(d)
     tmp = REDDIT_FAILS_FILE.with_suffix(".json.tmp")
-    tmp.write_text(json.dumps(d, indent=2))
-    tmp.replace(REDDIT_FAILS_FILE)
-
-def _mark_reddit_fail(reddit_id: str, reason: str):
-    d = _load_reddit_fails()
+    tmp.write_bytes(_dumps_compact(d))
+    os.replace(tmp, REDDIT_FAILS_FILE)
+
+def _mark_reddit_fail(reddit_id: str, reason: str, d: dict | None = None):
+    """Bump the fail counter. With a caller-held dict `d`, the caller flushes once at the end."""
+    flush = d is None
+    if flush:
+        d = _load_reddit_fails()
     e = d.get(reddit_id, {})
     e["count"] = int(e.get("count", 0)) + 1
     e["ts"] = time.time()
     e["reason"] = reason[:200]
     d[reddit_id] = e
-    _save_reddit_fails(d)
+    if flush:
+        _save_reddit_fails(d)
 
-def _should_skip_reddit_id(reddit_id: str) -> bool:
-    d = _load_reddit_fails()
+def _should_skip_reddit_id(reddit_id: str, d: dict | None = None) -> bool:
+    if d is None:
+        d = _load_reddit_fails()
     e = d.get(reddit_id)
     return bool(e and int(e.get("count", 0)) >= REDDIT_FAIL_MAX)
 
 # ─────────────────────────────────────────────
 # TOKEN MGMT (23h reuse)
 # ─────────────────────────────────────────────
-token_state = {}
-if TOKEN_FILE.exists():
-    try:
-        token_state = json.load(open(TOKEN_FILE))
-    except Exception as e:
-        log(f"⚠️ Failed to read token cache: {e}")
-
-def lemmy_login(force=False):
-    """Return a valid Lemmy JWT, reusing cached token for up to 23h."""
-    global token_state
-
-    if not force and token_state.get("jwt"):
-        age = time.time() - token_state.get("ts", 0)
-        if age < TOKEN_REUSE_HOURS * 3600:
-            log(f"🔁 Using cached Lemmy token (age={int(age)}s)")
-            return token_state["jwt"]
+token_state: dict | None = None  # token.json, loaded by _token_state() on first use
+
+# Current JWT, only ever replaced by lemmy_login(); hot-path readers use this directly
+_JWT: str = ""
+_last_token_log_ts = float("-inf")
+# Single-flight: concurrent 401 handlers share one login instead of racing
+_login_lock = threading.Lock()
+LOGIN_DEDUP_SECS = 30  # a login this recent satisfies force=True callers too
+
+def _token_state() -> dict:
+    global token_state, _JWT
+    if token_state is None:
+        token_state = {}
+        if TOKEN_FILE.exists():
+            try:
+                token_state = _read_json_file(TOKEN_FILE)
+            except Exception as e:
+                log(f"⚠️ Failed to read token cache: {e}")
+        _JWT = _JWT or token_state.get("jwt", "")
+    return token_state
+
+def _save_token_file(state: dict):
+    """Write token.json via a 0600 tmp file + rename so the JWT is never world-readable."""
+    tmp = Path(str(TOKEN_FILE) + ".tmp")
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(_dumps_compact(state))
+    os.chmod(tmp, 0o600)  # O_CREAT mode is ignored if tmp already existed
+    os.replace(tmp, TOKEN_FILE)
+
+def _token_fresh(refresh_skew: float) -> bool:
+    return bool(_JWT) and _age_since(token_state.get("ts", 0)) < TOKEN_REUSE_SECS - refresh_skew
+
+def lemmy_login(force=False, refresh_skew: float = TOKEN_REFRESH_SKEW, stale_jwt: str | None = None):
+    """
+    Return a valid Lemmy JWT, reusing cached token for up to 23h (minus refresh_skew).
+    stale_jwt: the token a request was rejected with (401). If another caller has
+    already replaced it by the time we hold the lock, that new token is returned
+    instead of logging in again, so N concurrent 401s cost one login.
+    """
+    global _last_token_log_ts
+    _token_state()
+
+    if not force and _JWT:
+        age = _age_since(token_state.get("ts", 0))
+        if _token_fresh(refresh_skew):
+            if time.monotonic() - _last_token_log_ts >= TOKEN_LOG_EVERY_SECS:
+                _last_token_log_ts = time.monotonic()
+                log(f"🔁 Using cached Lemmy token (age={int(age)}s)")
+            _set_session_jwt(_JWT)
+            return _JWT
+
+    with _login_lock:
+        # Double-checked: another caller may have refreshed while we waited for the lock.
+        # The time-based dedup never applies to a 401 retry: if stale_jwt is still the
+        # current token it was just rejected, however fresh it is.
+        if (not force and _token_fresh(refresh_skew)) or \
+                (stale_jwt and _JWT and _JWT != stale_jwt) or \
+                (stale_jwt is None and _JWT and _age_since(token_state.get("ts", 0)) < LOGIN_DEDUP_SECS):
+            _set_session_jwt(_JWT)
+            return _JWT
+        return _lemmy_login_locked()
+
+def _lemmy_login_locked():
+    """The actual login; callers must hold _login_lock."""
+    global token_state, _JWT
 
     log(f"🔑 Attempting fresh login to {LEMMY_URL} as {LEMMY_USER}")
 
     # Reuse very freshly refreshed token by another proc
     if TOKEN_FILE.exists():
-        age = time.time() - TOKEN_FILE.stat().st_mtime
+        age = _age_since(TOKEN_FILE.stat().st_mtime)
         if age < 60:
             try:
-                data = json.load(open(TOKEN_FILE))
+                data = load_json(TOKEN_FILE, {})
                 if data.get("jwt"):
                     log(f"♻️ Using recently refreshed token (age={int(age)}s)")
                     token_state.update(data)
-                    return data["jwt"]
+                    _JWT = data["jwt"]
+                    _set_session_jwt(_JWT)
+                    return _JWT
             except Exception:
                 pass
 
-    r = requests.post(
-        f"{LEMMY_URL}/api/v3/user/login",
+    # Never send a stale Bearer along with the credentials
+    _set_session_jwt(None)
+    get_limiter("lemmy_login").acquire()
+    r = SESSION.post(
+        LEMMY_API_LOGIN,
         json={"username_or_email": LEMMY_USER, "password": LEMMY_PASS},
         timeout=20,
     )
-    if r.status_code == 400 and "rate_limit" in r.text:
-        log("⏳ Lemmy rate-limited login — waiting 30s before retry…")
-        time.sleep(30)
-        return lemmy_login(force=True)
+    if r.status_code in (400, 429) and "rate_limit" in r.text:
+        wait = _rate_reset_wait() or backoff_delay(2, base=8, retry_after=retry_after_secs(r.headers))
+        log(f"⏳ Lemmy rate-limited login — waiting {wait:.0f}s before retry…")
+        time.sleep(wait)
+        return _lemmy_login_locked()
     if not r.ok:
         raise RuntimeError(f"Lemmy login failed: {r.status_code} {r.text[:300]}")
 
-    data = r.json()
+    data = _json_body(r)
     jwt = data.get("jwt")
     if not jwt:
         raise RuntimeError(f"No JWT returned: {data}")
 
+    persisted = token_state.get("jwt")
     token_state = {"jwt": jwt, "ts": time.time(), "last_login": time.time()}
-    save_json(TOKEN_FILE, token_state)
+    _JWT = jwt
+    if jwt != persisted:
+        _save_token_file(token_state)
+    _set_session_jwt(jwt)
     log("✅ Logged into Lemmy (token cached)")
     return jwt
 
@@ -219,70 +504,83 @@ def get_valid_token():
         return lemmy_login(force=True)
 
 def get_cached_jwt():
-    try:
-        data = json.load(open(TOKEN_FILE))
-        return data.get("jwt")
-    except Exception:
-        return token_state.get("jwt")
+    if _JWT:
+        return _JWT
+    return load_json(TOKEN_FILE, {}).get("jwt") or _token_state().get("jwt")
 
 # ─────────────────────────────────────────────
 # MEDIA HELPERS
 # ─────────────────────────────────────────────
+_MD_TRANS = str.maketrans({"|": r"\|", "<": "&lt;", ">": "&gt;"})
+
 def md_escape(text: str) -> str:
     if not text:
         return ""
-    return text.replace("|", r"\|").replace("<", "&lt;").replace(">", "&gt;")
+    return text.translate(_MD_TRANS)
 
 def to_md(text: str) -> str:
     if not text:
         return ""
     return unescape(text)
 
-def is_image_url(u: str) -> bool:
-    return bool(re.search(r"\.(png|jpe?g|gif|webp)(\?.*)?$", u or "", re.I))
+@dataclass(frozen=True, slots=True)
+class SubmissionView:
+    """The fields the body builder reads, normalized once from Reddit JSON or a praw object."""
+    selftext: str
+    url: str
+    is_gallery: bool
+    gallery_data: dict | None
+    media_metadata: dict | None
+
+    @classmethod
+    def from_any(cls, sub) -> "SubmissionView":
+        if isinstance(sub, cls):
+            return sub
+        get = sub.get if isinstance(sub, dict) else (lambda k: getattr(sub, k, None))
+        return cls(
+            selftext=get("selftext") or "",
+            url=get("url") or "",
+            is_gallery=bool(get("is_gallery")),
+            gallery_data=get("gallery_data"),
+            media_metadata=get("media_metadata"),
+        )
 
-def guess_imgur_direct(u: str) -> str | None:
-    m = re.match(r"https?://(www\.)?imgur\.com/([A-Za-z0-9]+)$", u or "", re.I)
-    if m:
-        return f"https://i.imgur.com/{m.group(2)}.jpg"
-    return None
+_VIDEO_EXTS = (".mp4", ".webm", ".mov")
 
-def _get(obj, key, default=None):
-    if isinstance(obj, dict):
-        return obj.get(key, default)
-    return getattr(obj, key, default)
+# Body templates: one format per media line, one for "text, rule, media"
+_TPL_VIDEO = "[Video]({url})"
+_TPL_IMAGE = "![{label}]({url})"
+_TPL_TEXT_MEDIA = "{text}\n\n---\n\n{media}"
 
-def _append_mirrored_media_line(media_lines: list[str], mirrored: str, label: str = "Image") -> None:
+def _mirrored_media_line(mirrored: str, label: str = "Image") -> str:
     # If mirror_url returned markdown already (e.g. "[Video](...)"), use it as-is.
     if mirrored.startswith("[") and "](" in mirrored:
-        media_lines.append(mirrored)
-        return
+        return mirrored
 
     low = mirrored.lower()
-    if any(low.endswith(ext) for ext in (".mp4", ".webm", ".mov")):
-        media_lines.append(f"[Video]({mirrored})")
-    else:
-        media_lines.append(f"![{label}]({mirrored})")
+    if low.endswith(_VIDEO_EXTS):
+        return _TPL_VIDEO.format(url=mirrored)
+    return _TPL_IMAGE.format(label=label, url=mirrored)
 
 def build_media_block_from_submission(sub) -> tuple[str, str | None]:
     """
     Constructs a Lemmy post body by mirroring all Reddit media locally.
     Ensures no outbound links to Reddit remain for images or videos.
     """
-    from mirror_media import mirror_url
-    body_parts, media_lines = [], []
+    media_buf = io.StringIO()  # one line per mirrored item, "\n"-separated
     primary_url: str | None = None
+    view = SubmissionView.from_any(sub)
+    is_gallery = view.is_gallery
 
     # Extract and clean self-text
-    st = to_md(_get(sub, "selftext", "") or "")
-    if st.strip():
-        body_parts.append(st)
+    st = to_md(view.selftext)
+    has_text = bool(st.strip())
 
     # 1. Handle Reddit Galleries
-    if bool(_get(sub, "is_gallery", False)) and _get(sub, "gallery_data") and _get(sub, "media_metadata"):
+    if is_gallery and view.gallery_data and view.media_metadata:
         try:
-            items = _get(sub, "gallery_data", {}).get("items", [])[:MAX_GALLERY_IMAGES]
-            media_meta = _get(sub, "media_metadata", {})
+            items = view.gallery_data.get("items", [])[:MAX_GALLERY_IMAGES]
+            media_meta = view.media_metadata
             for idx, it in enumerate(items, 1):
                 media_id = it.get("media_id")
                 meta = media_meta.get(media_id, {})
@@ -301,19 +599,22 @@ def build_media_block_from_submission(sub) -> tuple[str, str | None]:
                     # Mirror to local infrastructure
                     mirrored_src = mirror_url(src.replace("&amp;", "&"))
                     if mirrored_src:
-                        caption = it.get("caption") or ""
-                        cap = f" — {md_escape(caption)}" if caption else ""
-                        _append_mirrored_media_line(media_lines, mirrored_src, label=f"Image {idx}")
-                        if cap:
-                            # Append caption as text on the same line (keeps markdown valid)
-                            media_lines[-1] = f"{media_lines[-1]}{cap}"
+                        line = _mirrored_media_line(mirrored_src, label=f"Image {idx}")
+                        caption = it.get("caption")
+                        # Caption goes on the same line as the image (keeps markdown valid)
+                        if media_buf.tell():
+                            media_buf.write("\n")
+                        media_buf.write(line)
+                        if caption:
+                            media_buf.write(" — ")
+                            media_buf.write(md_escape(caption))
         except Exception as e:
             log(f"⚠️ Gallery mirroring failed: {e}")
 
     # 2. Handle Single Images and Videos
     # Only process if not already handled as a gallery
-    elif not bool(_get(sub, "is_gallery", False)):
-        url = _get(sub, "url", "")
+    elif not is_gallery:
+        url = view.url
         if url:
             # Mirror the URL (mirror_url now handles video downloading/hosting)
             mirrored_url = mirror_url(url)
@@ -326,56 +627,119 @@ def build_media_block_from_submission(sub) -> tuple[str, str | None]:
                 if (not is_markdown) and is_pictrs:
                     primary_url = mirrored_url
                     # Optional: also show it in the body; I'd recommend NOT duplicating:
-                    # _append_mirrored_media_line(media_lines, mirrored_url, label="Media")
+                    # media_buf.write(_mirrored_media_line(mirrored_url, label="Media"))
                 else:
-                    _append_mirrored_media_line(media_lines, mirrored_url, label="Media")
+                    media_buf.write(_mirrored_media_line(mirrored_url, label="Media"))
 
     # Combine text and mirrored media
-    if media_lines:
-        if st.strip():
-            body_parts.append("\n---\n")
-        body_parts += media_lines
-
-    return ("\n".join(body_parts).strip(), primary_url)
+    media = media_buf.getvalue()
+    if not media:
+        body = st
+    elif has_text:
+        body = _TPL_TEXT_MEDIA.format(text=st, media=media)
+    else:
+        body = media
+    return (body.strip(), primary_url)
 
 # ─────────────────────────────────────────────
 # COMMUNITY CACHE + LOOKUP
 # ─────────────────────────────────────────────
+# Parsed community_map.json kept in memory. "map" holds only lower-cased
+# community names → ids; the bookkeeping (_fetched_at, _etag, _last_modified)
+# lives in "meta", persisted to its own sidecar file so the map has no reserved keys.
+_COMM_CACHE = {"map": None, "meta": {}}
+
+def _community_map() -> dict:
+    """In-memory community map; the files are only read once, we are their sole writer."""
+    if _COMM_CACHE["map"] is None:
+        raw = load_json(COMMUNITY_MAP_FILE, {})
+        mapping, legacy_meta = {}, {}
+        for k, v in raw.items():
+            if k.startswith("_"):
+                legacy_meta[k] = v  # older files kept the bookkeeping inline
+            else:
+                mapping[k.lower()] = v
+        _COMM_CACHE["map"] = mapping
+        _COMM_CACHE["meta"] = dict(load_json(COMMUNITY_META_FILE, None) or legacy_meta)
+    return _COMM_CACHE["map"]
+
+def _community_meta() -> dict:
+    _community_map()
+    return _COMM_CACHE["meta"]
+
+def _community_map_stale() -> bool:
+    return not _community_map() or _age_since(_community_meta().get("_fetched_at", 0)) > COMMUNITY_REFRESH_HOURS * 3600
+
+def _store_community_map(mapping: dict, meta: dict, mapping_changed: bool = True):
+    _COMM_CACHE["map"], _COMM_CACHE["meta"] = mapping, meta
+    if mapping_changed:
+        save_json_fast(COMMUNITY_MAP_FILE, mapping)
+    save_json_fast(COMMUNITY_META_FILE, meta)
+
 def refresh_community_map(jwt):
-    headers = {"Authorization": f"Bearer {jwt}"}
+    _ensure_session_jwt(jwt)
     try:
-        r = requests.get(f"{LEMMY_URL}/api/v3/community/list", headers=headers, timeout=20)
+        # Conditional GET: validators from the last full fetch live alongside the map
+        current, meta = _community_map(), dict(_community_meta())
+        headers = {}
+        if meta.get("_etag"):
+            headers["If-None-Match"] = meta["_etag"]
+        if meta.get("_last_modified"):
+            headers["If-Modified-Since"] = meta["_last_modified"]
+
+        r = SESSION.get(LEMMY_API_COMMUNITY_LIST, headers=headers, timeout=20)
+        if r.status_code == 304:
+            meta["_fetched_at"] = time.time()
+            _store_community_map(current, meta, mapping_changed=False)
+            return
         if not r.ok:
             # Quiet mode: only warn on failure
             log(f"⚠️ Failed to fetch communities: {r.status_code} {r.text[:200]}")
             return
-        data = r.json()
+        data = _json_body(r)
         mapping = {c["community"]["name"].lower(): c["community"]["id"] for c in data.get("communities", [])}
-        mapping["_fetched_at"] = time.time()
-        save_json(COMMUNITY_MAP_FILE, mapping)
+        meta = {"_fetched_at": time.time()}
+        if r.headers.get("ETag"):
+            meta["_etag"] = r.headers["ETag"]
+        if r.headers.get("Last-Modified"):
+            meta["_last_modified"] = r.headers["Last-Modified"]
+        _store_community_map(mapping, meta)
+        invalidate_sub_map_resolved()
         # quiet success (no log)
     except Exception as e:
         log(f"⚠️ Community map refresh error: {e}")
 
 def get_community_id(name: str, jwt: str) -> int:
     """
-    Prefer direct name lookup endpoint, fallback to cache.
+    Serve from the in-memory map (refreshed once it goes stale), and only
+    ask the direct name lookup endpoint for names the list doesn't have.
     Caches successful lookups back into community_map.json.
     """
     name = name.lower().strip()
-    headers = {"Authorization": f"Bearer {jwt}"}
+
+    # 0) Stale map: one conditional list refresh (usually a 304) for every
+    #    name, instead of a direct lookup per name until the next refresh
+    if _community_map_stale():
+        refresh_community_map(jwt)
+
+    # In-memory hit: a single dict lookup, no disk read or scan
+    cid = _community_map().get(name)
+    if cid is not None:
+        return cid
+
+    _ensure_session_jwt(jwt)
 
     # 1) Direct name lookup
     try:
-        r = requests.get(f"{LEMMY_URL}/api/v3/community", params={"name": name}, headers=headers, timeout=15)
+        r = SESSION.get(LEMMY_API_COMMUNITY, params={"name": name}, timeout=15)
         if r.ok:
-            data = r.json()
+            data = _json_body(r)
             if "community_view" in data:
                 cid = data["community_view"]["community"]["id"]
-                mapping = load_json(COMMUNITY_MAP_FILE, {})
+                mapping = dict(_community_map())
                 mapping[name] = cid
-                mapping["_fetched_at"] = time.time()
-                save_json(COMMUNITY_MAP_FILE, mapping)
+                # One name doesn't make the whole list fresh: _fetched_at is left alone
+                _store_community_map(mapping, _community_meta())
                 # quiet success
                 return cid
         else:
@@ -383,36 +747,57 @@ def get_community_id(name: str, jwt: str) -> int:
     except Exception as e:
         log(f"⚠️ Exception during community lookup for '{name}': {e}")
 
-    # 2) Fallback to cached map (refresh if stale)
-    mapping = load_json(COMMUNITY_MAP_FILE, {})
-    if not mapping or time.time() - mapping.get("_fetched_at", 0) > COMMUNITY_REFRESH_HOURS * 3600:
-        refresh_community_map(jwt)
-        mapping = load_json(COMMUNITY_MAP_FILE, {})
+    raise RuntimeError(f"community lookup error: could not resolve '{name}' (case-insensitive)")
 
-    for k, v in mapping.items():
-        if k.lower() == name:
-            return v
+# reddit_sub → (lemmy_comm, community_id); rebuilt only after an invalidation
+SUB_MAP_RESOLVED: dict[str, tuple[str, int]] = {}
 
-    raise RuntimeError(f"community lookup error: could not resolve '{name}' (case-insensitive)")
+def invalidate_sub_map_resolved():
+    """Drop resolved ids; called when the community map or SUB_MAP changes."""
+    global SUB_MAP_RESOLVED
+    SUB_MAP_RESOLVED = {}
+
+def resolve_sub_map(jwt) -> dict[str, tuple[str, int]]:
+    global SUB_MAP_RESOLVED
+    if SUB_MAP_RESOLVED:
+        return SUB_MAP_RESOLVED
+
+    resolved, unresolved = {}, []
+    for reddit_sub, lemmy_comm in list(SUB_MAP.items()):  # snapshot; reload thread may swap SUB_MAP
+        try:
+            resolved[reddit_sub] = (lemmy_comm, get_community_id(lemmy_comm, jwt))
+        except Exception:
+            unresolved.append(f"r/{reddit_sub} → c/{lemmy_comm}")
+    if unresolved:
+        log(f"⚠️ Skipping {len(unresolved)} unresolved communities this cycle: {', '.join(unresolved)}")
+    else:
+        # Only memoize a complete resolution so failures are retried next cycle
+        SUB_MAP_RESOLVED = resolved
+    return resolved
 
 # ─────────────────────────────────────────────
 # .ENV HOT-RELOAD (quiet unless changes/errors)
 # ─────────────────────────────────────────────
+_dotenv_mtime_ns: int | None = None  # .env mtime at the last parse
+
 def reload_sub_map():
     """
     Reload SUB_MAP from DOTENV_PATH (quiet unless changed).
-    If the .env is missing, silently no-op.
+    If the .env is missing, silently no-op. An unchanged mtime costs one stat().
     """
-    global SUB_MAP
-    try:
-        from dotenv import dotenv_values
-    except Exception:
+    global SUB_MAP, _dotenv_mtime_ns
+    if dotenv_values is None or not DOTENV_PATH:
         # If python-dotenv not installed, bail quietly
         return
 
     try:
-        if not DOTENV_PATH or not Path(DOTENV_PATH).exists():
+        try:
+            mtime_ns = os.stat(DOTENV_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime_ns == _dotenv_mtime_ns:
             return
+        _dotenv_mtime_ns = mtime_ns
         env = dotenv_values(DOTENV_PATH)
         new_raw = env.get("SUB_MAP", "")
         if not new_raw:
@@ -426,6 +811,7 @@ def reload_sub_map():
 
         if added or removed:
             SUB_MAP = new_map
+            invalidate_sub_map_resolved()
             log(f"♻️ Reloaded SUB_MAP from .env (added={added or []}, removed={removed or []})")
         else:
             # quiet if no changes
@@ -442,7 +828,7 @@ def start_auto_refresh(jwt):
     Logs only on changes or errors.
     """
     def loop():
-        last_community_refresh = time.time()
+        last_community_refresh = time.monotonic()
         try:
             reload_sub_map()
             refresh_community_map(jwt)
@@ -456,9 +842,9 @@ def start_auto_refresh(jwt):
                 reload_sub_map()
 
                 # Refresh community map if its interval has passed
-                if time.time() - last_community_refresh >= COMMUNITY_REFRESH_HOURS * 3600:
+                if time.monotonic() - last_community_refresh >= COMMUNITY_REFRESH_HOURS * 3600:
                     refresh_community_map(jwt)
-                    last_community_refresh = time.time()
+                    last_community_refresh = time.monotonic()
 
             except Exception as e:
                 log(f"⚠️ Auto-refresh cycle error: {e}")
@@ -470,16 +856,18 @@ def start_auto_refresh(jwt):
 # ─────────────────────────────────────────────
 # POST CREATION (rate-limit + title sanitization)
 # ─────────────────────────────────────────────
+TITLE_MAX_LEN = 180  # Lemmy's own cap is 200; leave room for the ellipsis
+
+# One pass: line breaks/tabs → space, other control chars and zero-width chars dropped
+_TITLE_TRANS = {c: None for c in (*range(0x20), 0x7F, 0x200B, 0x200C, 0x200D)}
+_TITLE_TRANS.update(str.maketrans({"\n": " ", "\r": " ", "\t": " "}))
+
 def _sanitize_title(title: str, subreddit_name: str) -> str:
-    title = (title or "").strip()
-    title = html.unescape(title).replace("\n", " ").replace("\r", " ")
-    # Remove control chars / zero-width chars
-    title = re.sub(r"[\x00-\x1F\x7F]", "", title)
-    title = title.replace("\u200b", "").replace("\u200c", "").replace("\u200d", "")
+    title = html.unescape((title or "").strip()).translate(_TITLE_TRANS)
     if not title or len(title) < 3:
         title = f"Post from r/{subreddit_name} ({datetime.utcnow().strftime('%Y-%m-%d')})"
-    if len(title) > 180:
-        title = title[:177] + "…"
+    if len(title) > TITLE_MAX_LEN:
+        title = title[:TITLE_MAX_LEN - 3] + "…"
     return title
 
 def _maybe_wait_between_posts():
@@ -491,8 +879,8 @@ def create_lemmy_post(subreddit_name, post, jwt, community_id):
     Creates a Lemmy post using a 'no-loss' strategy. 
     Media is embedded in the body to ensure local hosting and permanent accessibility.
     """
-    headers = {"Authorization": f"Bearer {jwt}"}
-    
+    _ensure_session_jwt(jwt)
+
     try:
         # Construct the body with mirrored media links
         # link_override is ignored to prevent outbound Reddit links
@@ -508,31 +896,38 @@ def create_lemmy_post(subreddit_name, post, jwt, community_id):
     payload = {
         "name": title,
         "community_id": community_id,
-        "body": body_md,
     }
+    # Link/media-only posts: the url field carries the content, don't send an empty body
+    if body_md and body_md.strip():
+        payload["body"] = body_md
 
     # If we mirrored a primary media URL (e.g., pictrs-hosted mp4),
     # set it as the post URL so Lemmy frontends can embed it.
     if primary_url:
         payload["url"] = primary_url
 
-    url = f"{LEMMY_URL}/api/v3/post"
+    url = LEMMY_API_POST
 
     # Retry loop with exponential backoff for rate limits
-    backoff = 10
-    max_wait = 90
     attempts = 0
+    relogged = False  # a 401 gets one re-login; a second one is fatal
     
     while True:
         attempts += 1
         try:
-            r = requests.post(url, json=payload, headers=headers, timeout=20)
+            _wait_rate_window()
+            get_limiter("lemmy_post").acquire()
+            sent_jwt = _JWT
+            r = SESSION.post(url, json=payload, timeout=20)
+            _note_rate_headers(r)
 
             # Handle Authentication Expired
             if r.status_code == 401:
+                if relogged:
+                    raise RuntimeError("Lemmy post failed: 401 again after re-login")
                 log("⚠️ Lemmy returned 401, refreshing token...")
-                new_jwt = lemmy_login(force=True)
-                headers["Authorization"] = f"Bearer {new_jwt}"
+                lemmy_login(force=True, stale_jwt=sent_jwt)
+                relogged = True
                 continue
 
             text = r.text or ""
@@ -544,18 +939,18 @@ def create_lemmy_post(subreddit_name, post, jwt, community_id):
                 continue
 
             # Handle Rate Limits
-            if r.status_code == 400 and "rate_limit_error" in text:
-                wait = min(backoff, max_wait)
-                log(f"⏳ Lemmy rate-limited post — sleeping {wait}s (attempt {attempts})...")
+            if r.status_code in (400, 429) and "rate_limit" in text:
+                wait = _rate_reset_wait() or backoff_delay(
+                    attempts - 1, base=10, cap=90, retry_after=retry_after_secs(r.headers))
+                log(f"⏳ Lemmy rate-limited post — sleeping {wait:.0f}s (attempt {attempts})...")
                 time.sleep(wait)
-                backoff = int(backoff * 1.7) + 5
                 continue
 
             if not r.ok:
                 raise RuntimeError(f"Lemmy post failed: {r.status_code} {text[:200]}")
 
             # Successfully created
-            pid = r.json()["post_view"]["post"]["id"]
+            pid = _json_body(r)["post_view"]["post"]["id"]
             log(f"✅ Posted '{post.get('title','Untitled')}' → Lemmy ID={pid}")
 
             _maybe_wait_between_posts()
@@ -565,131 +960,226 @@ def create_lemmy_post(subreddit_name, post, jwt, community_id):
             log(f"⚠️ Connection error to Lemmy: {e}")
             if attempts >= 3:
                 raise
-            time.sleep(5)
+            time.sleep(backoff_delay(attempts - 1, base=2.5))
 
 # ─────────────────────────────────────────────
 # COMMENTS
 # ─────────────────────────────────────────────
+async def _arelogin(stale_auth: str, lock: asyncio.Lock):
+    """
+    Single-flight 401 handling for concurrent tasks: the first task through
+    the lock logs in, the rest see the Authorization header already changed.
+    """
+    async with lock:
+        current = SESSION.headers.get("Authorization", "")
+        if current and current != stale_auth:
+            return
+        stale_jwt = stale_auth.removeprefix("Bearer ") or None
+        await asyncio.to_thread(lemmy_login, True, TOKEN_REFRESH_SKEW, stale_jwt)
+
+async def _post_comment_async(session, url, payload, sem, login_lock) -> bool:
+    """POST one comment; only sleeps when Lemmy reports the window is exhausted."""
+    async with sem:
+        for attempt in range(3):
+            if _rate_state["remaining"] == 0:
+                await asyncio.sleep(_rate_reset_wait())
+            await get_limiter("lemmy_comment").acquire_async()
+            try:
+                headers = {"Authorization": SESSION.headers.get("Authorization", "")}
+                async with session.post(url, json=payload, headers=headers) as r:
+                    _note_rate_headers(r)
+                    status, text = r.status, await r.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                log(f"⚠️ Error posting comment: {e}")
+                return False
+
+            if status == 401 and attempt == 0:
+                log("⚠️ Comment post 401, retrying with refreshed token…")
+                await _arelogin(headers["Authorization"], login_lock)
+                continue
+
+            if status in (400, 429) and "rate_limit" in text:
+                await asyncio.sleep(_rate_reset_wait() or backoff_delay(
+                    attempt, base=5, retry_after=retry_after_secs(r.headers)))
+                continue
+
+            if status >= 400:
+                log(f"⚠️ Comment failed: {status} {text[:200]}")
+                return False
+            return True
+        return False
+
+async def _mirror_comments_async(url, payloads) -> int:
+    sem = asyncio.Semaphore(COMMENT_WORKERS)
+    login_lock = asyncio.Lock()
+    session = await _http_session()
+    results = await asyncio.gather(
+        *(_post_comment_async(session, url, p, sem, login_lock) for p in payloads),
+        return_exceptions=True,
+    )
+    for res in results:
+        if isinstance(res, BaseException):
+            log(f"⚠️ Error posting comment: {res}")
+    return sum(1 for res in results if res is True)
+
 def mirror_comments(sub, post_id, comments, jwt):
     if not comments:
         log("✅ No comments to mirror.")
         return
 
-    url = f"{LEMMY_URL}/api/v3/comment"
-    headers = {"Authorization": f"Bearer {jwt}"}
+    url = LEMMY_API_COMMENT
+    _ensure_session_jwt(jwt)
 
+    payloads = []
     for c in comments:
         if not hasattr(c, "body"):
             continue
         content = getattr(c, "body", "").strip()
         if not content:
             continue
+        payloads.append({"content": content, "post_id": int(post_id)})
 
-        payload = {"content": content, "post_id": int(post_id)}
-        try:
-            r = requests.post(url, json=payload, headers=headers, timeout=20)
-            if r.status_code == 401:
-                log("⚠️ Comment post 401, retrying with refreshed token…")
-                new_jwt = lemmy_login(force=True)
-                headers["Authorization"] = f"Bearer {new_jwt}"
-                r = requests.post(url, json=payload, headers=headers, timeout=20)
-
-            if r.status_code == 400 and "rate_limit" in r.text:
-                time.sleep(10)
-                continue
-
-            if not r.ok:
-                log(f"⚠️ Comment failed: {r.status_code} {r.text[:200]}")
-                continue
-
-            time.sleep(3)
-        except Exception as e:
-            log(f"⚠️ Error posting comment: {e}")
-            continue
-
-    log(f"✅ Mirrored {len(comments)} comments.")
+    # Comments are posted flat (no parent_id), so they have no ordering dependency
+    ok = _run(_mirror_comments_async(url, payloads))
 
-# ─────────────────────────────────────────────
-# ALT POST BODY (used by update_existing_posts)
-# ─────────────────────────────────────────────
-def build_post_body(sub):
-    """
-    Standardizes the post body construction for both new mirrors and updates.
-    Ensures that all media is hosted locally and outbound Reddit links are stripped.
-    """
-    # Simply delegate to our primary mirroring logic to ensure consistency
-    # across the entire application.
-    content, _ = build_media_block_from_submission(sub)
-    return content
+    log(f"✅ Mirrored {ok}/{len(payloads)} comments.")
 
 # ─────────────────────────────────────────────
 # MIGRATION (legacy JSON → SQLite)
 # ─────────────────────────────────────────────
+def _legacy_row(val) -> tuple[str, str | None] | None:
+    """(lemmy_id, subreddit) from any legacy post_map value shape, or None if unusable."""
+    if isinstance(val, dict):
+        lemmy_id = str(val.get("lemmy_id") or val.get("lemmy_post_id") or "")
+        subreddit = val.get("subreddit") or None
+    elif isinstance(val, (int, str)):
+        lemmy_id, subreddit = str(val), None
+    else:
+        return None
+    return (lemmy_id, subreddit) if lemmy_id else None
+
 def migrate_legacy_json_to_sqlite(db: DB):
+    legacy_post_map = get_legacy_post_map()
     if not legacy_post_map:
         return
-    imported = skipped = 0
-    for reddit_id, val in legacy_post_map.items():
-        try:
-            if isinstance(val, dict):
-                lemmy_id = str(val.get("lemmy_id") or val.get("lemmy_post_id") or "")
-                subreddit = val.get("subreddit") or None
-            elif isinstance(val, int):
-                lemmy_id = str(val)
-                subreddit = None
-            elif isinstance(val, str):
-                lemmy_id = val
-                subreddit = None
-            else:
-                continue
-            if not lemmy_id:
-                continue
-            if db.get_lemmy_post_id(reddit_id):
-                skipped += 1
-                continue
-            db.save_post(reddit_id, lemmy_id, subreddit)
-            imported += 1
-        except Exception as e:
-            log(f"⚠️ Migration error for reddit_id={reddit_id}: {e}")
-    log(f"📦 Migration complete: imported={imported}, skipped(existing)={skipped}.")
+    # One SELECT up front; on every start after the first, nothing is left to insert
+    existing = {reddit_id for reddit_id, _ in db.get_all_posts()}
+    pending = [rid for rid in legacy_post_map if rid not in existing]
+    skipped = len(legacy_post_map) - len(pending)
+    if not pending:
+        log(f"📦 Migration complete: imported=0, skipped(existing)={skipped}.")
+        return
+    # Rows are generated straight into a single executemany transaction
+    rows = ((rid, *row) for rid in pending if (row := _legacy_row(legacy_post_map[rid])))
+    imported = db.save_posts_bulk(rows)
+    invalid = len(pending) - imported
+    log(f"📦 Migration complete: imported={imported}, skipped(existing)={skipped}, invalid={invalid}.")
 
 # ─────────────────────────────────────────────
 # FETCH ONE SUBMISSION (used by mirror_post_to_lemmy & updater)
 # ─────────────────────────────────────────────
-def fetch_reddit_submission(submission_id: str):
+REDDIT_BY_ID_BATCH = 100  # max fullnames Reddit accepts per /by_id/ call
+
+# App-only Reddit token, reused until shortly before it expires (Reddit issues 1h tokens)
+_reddit_token_state = {"token": None, "exp": 0.0}
+_reddit_token_lock = threading.Lock()
+
+def get_reddit_token(headers: dict) -> str | None:
+    """Cached client_credentials token, minted only when missing or within 60s of expiry."""
     client_id = os.getenv("REDDIT_CLIENT_ID")
     client_secret = os.getenv("REDDIT_CLIENT_SECRET")
+    if not (client_id and client_secret):
+        return None
+    with _reddit_token_lock:
+        if _reddit_token_state["token"] and time.monotonic() < _reddit_token_state["exp"] - 60:
+            return _reddit_token_state["token"]
+        token_url = "https://www.reddit.com/api/v1/access_token"
+        auth = requests.auth.HTTPBasicAuth(client_id, client_secret)
+        data = {"grant_type": "client_credentials"}
+        token_res = REDDIT_SESSION.post(token_url, auth=auth, data=data, headers=headers, timeout=15)
+        if not token_res.ok:
+            return None
+        body = _json_body(token_res)
+        token = body.get("access_token")
+        if not token:
+            return None
+        _reddit_token_state["token"] = token
+        _reddit_token_state["exp"] = time.monotonic() + float(body.get("expires_in", 3600))
+        return token
+
+def _reddit_oauth_headers(headers: dict) -> bool:
+    """Adds an app-only OAuth bearer to headers if creds are configured. Returns True on success."""
+    token = get_reddit_token(headers)
+    if not token:
+        return False
+    headers["Authorization"] = f"bearer {token}"
+    return True
+
+def fetch_reddit_submissions(submission_ids: list[str]) -> dict | None:
+    """
+    Batch fetch up to REDDIT_BY_ID_BATCH submissions in one /by_id/ request.
+    Returns {reddit_id: data} (missing/removed posts are simply absent),
+    or None if the batch call itself failed so callers can fall back per id.
+    """
+    if not submission_ids:
+        return {}
+    headers = {"User-Agent": "RedditToLemmyBridge/1.1.0 (by u/YourBotName)"}
+    names = ",".join(f"t3_{sid}" for sid in submission_ids[:REDDIT_BY_ID_BATCH])
+    if _reddit_oauth_headers(headers):
+        url = f"https://oauth.reddit.com/by_id/{names}.json"
+    else:
+        url = f"https://www.reddit.com/by_id/{names}.json"
+
+    for attempt in range(3):
+        get_limiter("reddit").acquire()
+        r = REDDIT_SESSION.get(url, headers=headers, params={"limit": REDDIT_BY_ID_BATCH}, timeout=30)
+        if r.status_code == 429:
+            time.sleep(backoff_delay(attempt, base=5, retry_after=retry_after_secs(r.headers)))
+            continue
+        if r.status_code == 401:
+            _reddit_token_state["token"] = None  # revoked early; mint a fresh one next call
+        if not r.ok:
+            log(f"⚠️ Reddit batch fetch failed ({len(submission_ids)} ids): {r.status_code}")
+            return None
+        break
+    else:
+        return None
+
+    try:
+        children = _json_body(r).get("data", {}).get("children", [])
+    except Exception as e:
+        log(f"⚠️ Failed to parse Reddit batch JSON: {e}")
+        return None
+    return {c["data"]["id"]: c["data"] for c in children if c.get("data", {}).get("id")}
+
+def fetch_reddit_submission(submission_id: str):
     user_agent = "RedditToLemmyBridge/1.1.0 (by u/YourBotName)"
 
-    base_url = f"https://www.reddit.com/comments/{submission_id}.json"
+    # /by_id/ returns just the submission; /comments/<id>.json would also send
+    # (and make us parse) the whole comment tree, which is thrown away here
+    base_url = f"https://www.reddit.com/by_id/t3_{submission_id}.json"
     headers = {"User-Agent": user_agent}
 
     # OAuth if creds provided
-    if client_id and client_secret:
-        token_url = "https://www.reddit.com/api/v1/access_token"
-        auth = requests.auth.HTTPBasicAuth(client_id, client_secret)
-        data = {"grant_type": "client_credentials"}
-        token_res = requests.post(token_url, auth=auth, data=data, headers=headers, timeout=15)
-        if token_res.ok:
-            token = token_res.json().get("access_token")
-            headers["Authorization"] = f"bearer {token}"
-            base_url = f"https://oauth.reddit.com/by_id/t3_{submission_id}.json"
+    if _reddit_oauth_headers(headers):
+        base_url = f"https://oauth.reddit.com/by_id/t3_{submission_id}.json"
 
     # Retry (429 backoff)
     for attempt in range(3):
-        r = requests.get(base_url, headers=headers, timeout=15)
+        get_limiter("reddit").acquire()
+        r = REDDIT_SESSION.get(base_url, headers=headers, timeout=15)
         if r.status_code == 429:
-            time.sleep(5 * (attempt + 1))
+            time.sleep(backoff_delay(attempt, base=5, retry_after=retry_after_secs(r.headers)))
             continue
+        if r.status_code == 401:
+            _reddit_token_state["token"] = None  # revoked early; mint a fresh one next call
         if not r.ok:
             log(f"⚠️ Reddit fetch failed for {submission_id}: {r.status_code}")
             return None
         break
 
-    time.sleep(2)
-
     try:
-        data = r.json()
+        data = _json_body(r)
     except Exception as e:
         log(f"⚠️ Failed to parse Reddit JSON for {submission_id}: {e}")
         return None
@@ -708,121 +1198,183 @@ def fetch_reddit_submission(submission_id: str):
 # ─────────────────────────────────────────────
 # UPDATE EXISTING POSTS (optional maintenance)
 # ─────────────────────────────────────────────
-def update_existing_posts():
-    db = DB()
-    start_time = time.time()
-
-    post_map_path = DATA_DIR / "post_map.json"
-    legacy_entries = {}
-    if post_map_path.exists():
-        try:
-            legacy_entries = json.loads(post_map_path.read_text())
-            log(f"🗂️ Loaded {len(legacy_entries)} legacy entries from post_map.json")
-        except Exception as e:
-            log(f"⚠️ Failed to read legacy post_map.json: {e}")
-
-    db_path = Path("/opt/Reddit-Mirror-2-Lemmy/data") / "jobs.db"
-    if not db_path.exists():
-        log(f"❌ jobs.db not found at {db_path}")
-        return
-
-    conn = sqlite3.connect(db_path)
-    tables = [r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type='table';")]
-    if "posts" not in tables:
-        log("❌ No 'posts' table found in jobs.db")
-        conn.close()
-        return
-
-    #cur = conn.execute("SELECT reddit_post_id, lemmy_post_id FROM posts")
-    cur = conn.execute("SELECT reddit_id, lemmy_id FROM posts")
-    rows = cur.fetchall()
-    conn.close()
-
-    all_entries = {r[0]: r[1] for r in rows}
-    all_entries.update(legacy_entries)
-
-    if not all_entries:
-        log("❌ No mirrored posts found in jobs.db or JSON.")
-        return
-
-    log(f"🔄 Updating {len(all_entries)} existing Lemmy posts with new media embeds…")
-
-    jwt = get_cached_jwt() or lemmy_login(force=True)
-    headers = {"Authorization": f"Bearer {jwt}"}
-    success = 0
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "8"))  # post/update PUTs in flight
+UPDATE_BODY_WORKERS = max(1, int(os.getenv("UPDATE_BODY_WORKERS", "4")))  # media rebuilds at once
+# Posts with a stored hash whose Reddit data was fetched within this window are skipped outright
+UPDATE_REFETCH_TTL_SECS = float(os.getenv("UPDATE_REFETCH_TTL_DAYS", "7")) * 86400
+
+def _payload_hash(payload: dict) -> str:
+    """Digest of the fields --update-existing writes, to skip PUTs that would change nothing."""
+    h = hashlib.blake2b(digest_size=16)
+    for key in ("name", "body", "url"):
+        h.update((payload.get(key) or "").encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+async def _aupdate_one(session, sem, login_lock, body_pool, reddit_id, post_id, sub_data,
+                       known_hash: str | None = None) -> tuple[bool, str | None]:
+    """
+    Rebuild one post's body and PUT it; retries 401/rate-limit/5xx a few times.
+    Returns (ok, hash to store); the hash is None when nothing new needs saving.
+    """
+    try:
+        clean_id = int(str(post_id).strip())
+    except ValueError:
+        log(f"❌ Skipping {reddit_id}: Lemmy ID '{post_id}' is not a valid number.")
+        return False, None
 
-    for reddit_id, post_id in all_entries.items():
-        if _should_skip_reddit_id(reddit_id):
-            log(f"⏭️ Skipping {reddit_id}: previously failed fetch >= {REDDIT_FAIL_MAX} times")
-            continue
+    async with sem:
         try:
-            sub_data = fetch_reddit_submission(reddit_id)          
-            if not sub_data:
-                _mark_reddit_fail(reddit_id, "no_data_returned")
-                log(f"⚠️ Unable to fetch Reddit data for {reddit_id}")
-                continue
-
-            # Ensure the ID is an integer
-            try:
-                clean_id = int(str(post_id).strip())
-            except ValueError:
-                log(f"❌ Skipping {reddit_id}: Lemmy ID '{post_id}' is not a valid number.")
-                continue
-
             reddit_title = sub_data.get("title") or "Untitled"
             clean_title = _sanitize_title(reddit_title, sub_data.get("subreddit", "mirror"))
-            new_body, primary_url = build_media_block_from_submission(sub_data)
-
-            update_url = f"{LEMMY_URL}/api/v3/post"
+            # Media mirroring is blocking (downloads + pictrs uploads). It gets its own
+            # bounded pool: the default executor also runs the blocking Reddit fetches.
+            new_body, primary_url = await asyncio.get_running_loop().run_in_executor(
+                body_pool, build_media_block_from_submission, sub_data)
 
             payload = {
-                "post_id": clean_id, 
+                "post_id": clean_id,
                 "name": clean_title,  # This fixes the 'missing field name' error
                 "body": new_body
             }
-            
             if primary_url:
                 payload["url"] = primary_url
 
-            # Using PUT for update as per Lemmy v3 API
-            r = requests.put(update_url, json=payload, headers=headers, timeout=20)
+            new_hash = _payload_hash(payload)
+            if new_hash == known_hash:
+                return True, None  # already up to date on Lemmy
+
+            for attempt in range(3):
+                if _rate_state["remaining"] == 0:
+                    await asyncio.sleep(_rate_reset_wait())
+                await get_limiter("lemmy_update").acquire_async()
+                # Using PUT for update as per Lemmy v3 API
+                headers = {"Authorization": SESSION.headers.get("Authorization", "")}
+                async with session.put(LEMMY_API_POST, json=payload, headers=headers) as r:
+                    _note_rate_headers(r)
+                    status, text = r.status, await r.text()
+
+                if status == 401 and attempt == 0:
+                    log("⚠️ post/update 401, refreshing token…")
+                    await _arelogin(headers["Authorization"], login_lock)
+                    continue
+
+                if status in (400, 429) and "rate_limit" in text:
+                    wait = _rate_reset_wait() or backoff_delay(
+                        attempt, base=10, retry_after=retry_after_secs(r.headers))
+                    log(f"⏳ Lemmy rate-limited post/update — sleeping {wait:.0f}s…")
+                    await asyncio.sleep(wait)
+                    continue
+
+                if status in (500, 502, 503):
+                    await asyncio.sleep(backoff_delay(attempt, base=2.5))
+                    continue
+
+                if status == 404:
+                    log(f"⚠️ Lemmy 404 updating post {reddit_id} (ID={post_id}).")
+                elif status >= 400:
+                    log(f"⚠️ Failed updating {reddit_id} (Lemmy ID={post_id}): {status} {text[:120]}")
+                else:
+                    return True, new_hash
+                return False, None
+            return False, None
 
-            text = r.text or ""
+        except Exception as e:
+            log(f"⚠️ Exception updating {reddit_id}: {e}")
+            return False, None
 
-            if r.status_code == 401:
-                log("⚠️ post/update 401, refreshing token…")
-                jwt = lemmy_login(force=True)
-                headers["Authorization"] = f"Bearer {jwt}"
-                r = requests.put(update_url, json=payload, headers=headers, timeout=20)
-                text = r.text or ""
-
-            if r.status_code == 400 and "rate_limit_error" in text:
-                # update endpoint rate limit
-                log("⏳ Lemmy rate-limited post/update — sleeping 30s…")
-                time.sleep(30)
-                continue
+async def _aupdate_posts(all_entries: dict, reddit_ids: list, reddit_fails: dict,
+                         body_hashes: dict) -> tuple[int, bool, list]:
+    """
+    Fetch Reddit data one /by_id/ batch at a time and fan the Lemmy updates
+    out concurrently, so the next batch is fetched while PUTs are in flight.
+    Returns (successful updates, whether reddit_fails changed,
+    [(reddit_id, lemmy_id, body_hash or None, fetched_at)] for every post
+    processed successfully; the hash is set only when a PUT was sent).
+    """
+    sem = asyncio.Semaphore(UPDATE_CONCURRENCY)
+    login_lock = asyncio.Lock()
+    tasks, task_ids = [], []
+    fails_dirty = False
+    fetched_at = time.time()
+
+    session = await _http_session()
+    body_pool = ThreadPoolExecutor(max_workers=UPDATE_BODY_WORKERS, thread_name_prefix="update-body")
+    try:
+        for n in range(0, len(reddit_ids), REDDIT_BY_ID_BATCH):
+            batch = reddit_ids[n:n + REDDIT_BY_ID_BATCH]
+            # One /by_id/ round-trip per REDDIT_BY_ID_BATCH posts instead of one per post
+            prefetched = await asyncio.to_thread(fetch_reddit_submissions, batch)
+            for reddit_id in batch:
+                if prefetched is not None:
+                    sub_data = prefetched.get(reddit_id)
+                else:
+                    sub_data = await asyncio.to_thread(fetch_reddit_submission, reddit_id)
+                if not sub_data:
+                    _mark_reddit_fail(reddit_id, "no_data_returned", reddit_fails)
+                    fails_dirty = True
+                    log(f"⚠️ Unable to fetch Reddit data for {reddit_id}")
+                    continue
+                tasks.append(asyncio.create_task(
+                    _aupdate_one(session, sem, login_lock, body_pool, reddit_id, all_entries[reddit_id],
+                                 sub_data, body_hashes.get(reddit_id))))
+                task_ids.append(reddit_id)
+
+        results = await asyncio.gather(*tasks)
+    finally:
+        body_pool.shutdown(wait=False)
+    state = [(rid, str(all_entries[rid]), h, fetched_at)
+             for rid, (ok, h) in zip(task_ids, results) if ok]
+    return len(state), fails_dirty, state
 
-            if r.status_code in (500, 502, 503):
-                time.sleep(5)
-                continue
+def update_existing_posts():
+    db = DB()
+    start_time = time.monotonic()
 
-            if r.status_code == 404:
-                log(f"⚠️ Lemmy 404 updating post {reddit_id} (ID={post_id}).")
-            elif not r.ok:
-                log(f"⚠️ Failed updating {reddit_id} (Lemmy ID={post_id}): {r.status_code} {r.text[:120]}")
-            else:
-                success += 1
+    # The posts table is the source of truth; the legacy JSON is read at most once per process
+    all_entries = dict(db.get_all_posts())
+    all_entries.update(get_legacy_post_map())
+
+    if not all_entries:
+        log("❌ No mirrored posts found in jobs.db or JSON.")
+        return
+
+    log(f"🔄 Updating {len(all_entries)} existing Lemmy posts with new media embeds…")
 
-            time.sleep(1.5)
-            if success and success % 25 == 0:
-                time.sleep(5)
+    jwt = get_cached_jwt() or lemmy_login(force=True)
+    _ensure_session_jwt(jwt)
 
-        except Exception as e:
-            log(f"⚠️ Exception updating {reddit_id}: {e}")
+    # Load the failure counters once per run and flush them once at the end
+    reddit_fails = _load_reddit_fails()
+
+    update_state = db.get_post_update_state()
+    body_hashes = {rid: h for rid, (h, _) in update_state.items() if h}
+    fresh_cutoff = time.time() - UPDATE_REFETCH_TTL_SECS
+
+    reddit_ids, fresh = [], 0
+    for reddit_id in all_entries:
+        if _should_skip_reddit_id(reddit_id, reddit_fails):
+            log(f"⏭️ Skipping {reddit_id}: previously failed fetch >= {REDDIT_FAIL_MAX} times")
+            continue
+        # Hashed and fetched recently: skip the Reddit fetch and media rebuild entirely
+        body_hash, fetched_at = update_state.get(reddit_id, (None, None))
+        if body_hash and fetched_at and fetched_at > fresh_cutoff:
+            fresh += 1
             continue
+        reddit_ids.append(reddit_id)
 
-    duration = time.time() - start_time
-    log(f"✨ Done — updated {success}/{len(all_entries)} posts in {duration:.1f}s.")
+    success, fails_dirty, state = _run(
+        _aupdate_posts(all_entries, reddit_ids, reddit_fails, body_hashes))
+
+    if fails_dirty:
+        _save_reddit_fails(reddit_fails)
+    if state:
+        db.save_post_update_state(state)
+    changed = sum(1 for _, _, h, _ in state if h)
+    log(f"🧮 {fresh} posts skipped (fetched within TTL), {success - changed} already up to date, {changed} changed.")
+
+    duration = time.monotonic() - start_time
+    log(f"✨ Done — updated {success}/{len(reddit_ids)} fetched posts in {duration:.1f}s.")
 # ─────────────────────────────────────────────
 # MIRROR CORE (called by worker)
 # ─────────────────────────────────────────────
@@ -836,11 +1388,11 @@ async def mirror_post_to_lemmy(payload: dict):
         raise ValueError(f"Missing reddit_id in payload: {payload}")
 
     db = DB()
-    post_data = fetch_reddit_submission(reddit_id)
+    # Every step below is blocking HTTP; run it in a thread so the worker's loop stays free
+    post_data = await asyncio.to_thread(fetch_reddit_submission, reddit_id)
     if not post_data:
         # Gracefully skip missing/deleted/private Reddit posts
-        from pathlib import Path as _Path
-        db_path = _Path(__file__).parent / "data" / "jobs.db"
+        db_path = Path(__file__).parent / "data" / "jobs.db"
         try:
             conn = sqlite3.connect(db_path)
             conn.execute(
@@ -855,24 +1407,25 @@ async def mirror_post_to_lemmy(payload: dict):
             log(f"⚠️ Failed to mark missing post {reddit_id} as skipped: {e}")
         return {"lemmy_id": None}
 
-    jwt = get_valid_token()
+    jwt = await asyncio.to_thread(get_valid_token)
     subreddit = post_data.get("subreddit")
     if not subreddit:
         raise RuntimeError("Missing subreddit info in Reddit post")
 
     # Map subreddit → community (from hot-reloaded SUB_MAP if present; else same name)
-    community_name = SUB_MAP.get(subreddit.lower(), subreddit.lower())
+    community_name = map_subreddit_to_community(subreddit)
 
-    comm_id = get_community_id(community_name, jwt)
-    lemmy_id = create_lemmy_post(subreddit, post_data, jwt, comm_id)
+    # Reuse the id resolved at enqueue time when it is for the same community
+    comm_id = payload.get("community_id") if payload.get("community_name") == community_name else None
+    comm_id = comm_id or await asyncio.to_thread(get_community_id, community_name, jwt)
+    lemmy_id = await asyncio.to_thread(create_lemmy_post, subreddit, post_data, jwt, comm_id)
     db.save_post(reddit_id, str(lemmy_id), subreddit)
 
     log(f"✅ Background mirror success: Reddit {reddit_id} → Lemmy {lemmy_id}")
 
     # Enqueue background comment mirror job
     try:
-        from pathlib import Path as _Path
-        db_path = _Path(__file__).parent / "data" / "jobs.db"
+        db_path = Path(__file__).parent / "data" / "jobs.db"
         conn = sqlite3.connect(db_path)
         cur = conn.execute(
             "SELECT 1 FROM jobs WHERE type='mirror_comment' AND json_extract(payload, '$.reddit_id') = ?",
@@ -889,7 +1442,7 @@ async def mirror_post_to_lemmy(payload: dict):
                 "VALUES (?, ?, ?, ?, ?, ?)",
                 (
                     "mirror_comment",
-                    json.dumps(payload2),
+                    _dumps_compact(payload2).decode("utf-8"),
                     "queued",
                     0,
                     datetime.utcnow().isoformat(),
@@ -907,21 +1460,66 @@ async def mirror_post_to_lemmy(payload: dict):
 # POLLER (enqueue jobs from subreddits)
 # ─────────────────────────────────────────────
 def map_subreddit_to_community(subreddit_name: str) -> str | None:
-    return subreddit_name.lower()
+    sub = subreddit_name.lower()
+    return SUB_MAP.get(sub, sub)
+
+SEEN_IDS_MAX = int(os.getenv("SEEN_IDS_MAX", "5000"))
+
+# Bounded LRU of Reddit ids already known to have a mirror_post job. /new only
+# returns recent submissions, so ids that age out of it can never come back.
+_seen_post_ids: "OrderedDict[str, None]" = OrderedDict()
+
+def _seen_post(reddit_post_id: str) -> bool:
+    if reddit_post_id in _seen_post_ids:
+        _seen_post_ids.move_to_end(reddit_post_id)
+        return True
+    return False
+
+def _mark_seen_post(reddit_post_id: str):
+    _seen_post_ids[reddit_post_id] = None
+    _seen_post_ids.move_to_end(reddit_post_id)
+    while len(_seen_post_ids) > SEEN_IDS_MAX:
+        _seen_post_ids.popitem(last=False)
+
+async def _fetch_reddit_listing(session, subreddit_name: str, params: dict) -> dict | None:
+    """GET /r/<sub>/new.json with 429 handling. Returns the listing 'data' dict or None."""
+    url = f"https://www.reddit.com/r/{subreddit_name}/new.json"
+    headers = {"User-Agent": "RedditToLemmyBridge/1.1 (by u/YourBotName)"}
+    for attempt in range(5):
+        await get_limiter("reddit").acquire_async()
+        async with session.get(url, params=params, headers=headers,
+                               timeout=aiohttp.ClientTimeout(total=20)) as r:
+            if r.status == 429:
+                wait = min(backoff_delay(attempt, base=5, retry_after=retry_after_secs(r.headers)), 60)  # cap at 1 min
+                print(f"⚠️ Reddit API rate-limited r/{subreddit_name} — waiting {wait:.0f}s before retry ({attempt+1}/5)…")
+                await asyncio.sleep(wait)
+                continue
+
+            if r.status != 200:
+                print(f"⚠️ Reddit API error {r.status} for r/{subreddit_name}")
+                return None
+
+            raw = await r.read()
+            data = orjson.loads(raw) if orjson is not None else json.loads(raw)
+            return data.get("data", {})
+    return None
+
+async def mirror_once_async(subreddit_name: str, test_mode: bool = False,
+                            community_name: str | None = None, community_id: int | None = None,
+                            session: "aiohttp.ClientSession | None" = None):
+    if session is None:
+        session = await _http_session()
 
-def mirror_once(subreddit_name: str, test_mode: bool = False):
     print(f"▶️ comment_mirror.py starting (refresh=False)")
     print(f"🔁 Fetching subreddit: r/{subreddit_name}")
 
-    db = JobDB()
-    community_name = map_subreddit_to_community(subreddit_name)
+    db = None  # opened only once an unseen submission shows up
+    community_name = community_name or map_subreddit_to_community(subreddit_name)
     if not community_name:
         print(f"⚠️ No community mapping found for r/{subreddit_name}")
         return
 
-    limit_str = str(POST_FETCH_LIMIT).lower()
-    fetch_all = limit_str in ("all", "none", "0")
-    per_page = 100 if fetch_all else int(POST_FETCH_LIMIT)
+    fetch_all, per_page = FETCH_ALL, FETCH_PER_PAGE
     max_batches = 10
 
     print(f"🔄 Live mode: Fetching from Reddit API (limit={'all' if fetch_all else per_page})…")
@@ -934,116 +1532,135 @@ def mirror_once(subreddit_name: str, test_mode: bool = False):
         if after:
             params["after"] = after
 
-        url = f"https://www.reddit.com/r/{subreddit_name}/new.json"
-        headers = {"User-Agent": "RedditToLemmyBridge/1.1 (by u/YourBotName)"}
-        # --- enhanced rate-limit handling ---
-        for attempt in range(5):
-            r = requests.get(url, params=params, headers=headers, timeout=20)
-
-            if r.status_code == 429:
-                retry_after = int(r.headers.get("Retry-After", "10"))
-                wait = min(retry_after, 60)  # cap at 1 min
-                print(f"⚠️ Reddit API rate-limited r/{subreddit_name} — waiting {wait}s before retry ({attempt+1}/5)…")
-                time.sleep(wait)
-                continue
-
-            if not r.ok:
-                print(f"⚠️ Reddit API error {r.status_code} for r/{subreddit_name}")
-                break
-
-            # success, exit retry loop
-            break
-        # --- end patch ---
-
-        data = r.json().get("data", {})
+        data = await _fetch_reddit_listing(session, subreddit_name, params) or {}
         children = data.get("children", [])
         if not children:
             break
 
+        # One IN (...) query per page for every id the in-memory LRU doesn't know
+        unseen = [c["data"]["id"] for c in children if not _seen_post(c["data"]["id"])]
+        if unseen and db is None:
+            db = JobDB()
+        existing_jobs = db.post_jobs_existing(unseen) if unseen else set()
+        to_enqueue: list[dict] = []  # written in one transaction after the page
+        reached_known = False  # everything on later pages is older than a known post
+
         for item in children:
             submission = item["data"]
             reddit_post_id = submission["id"]
-            title = submission.get("title", "[untitled]")
 
-            print(f"🪶 Found Reddit post {reddit_post_id}: {title}")
+            # Dedup first: known ids cost one LRU probe and nothing else
+            if _seen_post(reddit_post_id):
+                reached_known = True
+                fetched += 1
+                continue
 
-            cur = db.conn.execute(
-                "SELECT id FROM jobs WHERE type='mirror_post' "
-                "AND json_extract(payload, '$.reddit_post_id') = ?",
-                (reddit_post_id,),
-            )
-            existing_post_job = cur.fetchone()
+            print(f"🪶 Found Reddit post {reddit_post_id}: {submission.get('title', '[untitled]')}")
 
-            if not existing_post_job:
+            if reddit_post_id not in existing_jobs:
                 if test_mode:
                     print(f"🧪 [TEST MODE] Would enqueue mirror_post for Reddit {reddit_post_id}")
                 else:
                     print(f"🪶 Enqueuing mirror_post job for Reddit {reddit_post_id}")
-                    db.enqueue(
-                        "mirror_post",
-                        {
-                            "reddit_post_id": reddit_post_id,
-                            "community_name": community_name,
-                        },
-                    )
+                    job = {
+                        "reddit_post_id": reddit_post_id,
+                        "community_name": community_name,
+                    }
+                    if community_id is not None:
+                        job["community_id"] = community_id
+                    to_enqueue.append(job)
             else:
                 print(f"⏭️ mirror_post job already exists for Reddit {reddit_post_id}")
+                _mark_seen_post(reddit_post_id)
+                reached_known = True
 
             fetched += 1
 
+        if to_enqueue:
+            db.enqueue_many("mirror_post", to_enqueue)
+            for job in to_enqueue:
+                _mark_seen_post(job["reddit_post_id"])
+
         after = data.get("after")
         if not after:
             break
 
+        if reached_known and not PAGINATE_PAST_KNOWN:
+            print(f"⏹️ Reached already-mirrored posts in r/{subreddit_name} — not paging further.")
+            break
+
         if not fetch_all or fetched >= per_page * max_batches:
             break
 
+        # No fixed pause: the next page waits on the shared "reddit" limiter only
+        # when the budget is actually spent
         print(f"➡️ Fetched {fetched} posts so far — continuing to next page…")
-        time.sleep(2)
 
+    if db is not None:
+        db.conn.close()
     print(f"✨ Done — processed {fetched} posts from r/{subreddit_name}.")
 
-def mirror_loop(db: JobDB):
-    import praw
+def mirror_once(subreddit_name: str, test_mode: bool = False,
+                community_name: str | None = None, community_id: int | None = None):
+    """Sync wrapper for callers outside an event loop."""
+    return _run(mirror_once_async(subreddit_name, test_mode, community_name, community_id))
+
+async def mirror_subs_async(resolved: list, test_mode: bool = False):
+    """Poll all resolved (sub, community, id) triples concurrently over one HTTP session."""
+    sem = asyncio.Semaphore(SUBREDDIT_CONCURRENCY)
+
+    async def one(reddit_sub, lemmy_comm, comm_id):
+        async with sem:
+            await mirror_once_async(reddit_sub, test_mode, lemmy_comm, comm_id, session)
+
+    session = await _http_session()
+    # return_exceptions: one failing subreddit never cancels the others
+    results = await asyncio.gather(*(one(*t) for t in resolved), return_exceptions=True)
+
+    for (reddit_sub, lemmy_comm, _), res in zip(resolved, results):
+        if isinstance(res, Exception):
+            log(f"⚠️ Error while mirroring r/{reddit_sub} → c/{lemmy_comm}: {res}")
+
+# Set by SIGTERM/SIGINT; every long wait in the main loop goes through it
+SHUTDOWN = threading.Event()
 
+def _request_shutdown(signum, _frame):
+    log(f"🛑 Received {signal.Signals(signum).name}, shutting down after the current step…")
+    SHUTDOWN.set()
+
+def mirror_loop(db: JobDB):
     jwt = get_valid_token()
     start_auto_refresh(jwt)  # quiet background refresher
 
-    # (praw used only for auth UA baseline; polling uses public JSON here)
-    reddit = praw.Reddit(
-        client_id=os.getenv("REDDIT_CLIENT_ID"),
-        client_secret=os.getenv("REDDIT_CLIENT_SECRET"),
-        user_agent="reddit-lemmy-bridge",
-    )
-
-    while True:
+    while not SHUTDOWN.is_set():
         log("🔁 Running refresh cycle…")
-        # NOTE: SUB_MAP may be updated silently by the background thread
-        items = list(SUB_MAP.items())  # snapshot to avoid mid-iteration mutation
-        for reddit_sub, lemmy_comm in items:
-            try:
-                mirror_once(subreddit_name=reddit_sub, test_mode=TEST_MODE)
-            except Exception as e:
-                log(f"⚠️ Error while mirroring r/{reddit_sub} → c/{lemmy_comm}: {e}")
+        # NOTE: SUB_MAP may be updated silently by the background thread,
+        # which invalidates SUB_MAP_RESOLVED so it is re-resolved here
+        resolved = [(s, c, cid) for s, (c, cid) in resolve_sub_map(jwt).items()]
+
+        _run(mirror_subs_async(resolved, test_mode=TEST_MODE))
 
         log(f"🕒 Sleeping {SLEEP_BETWEEN_CYCLES}s…")
-        import random
         jitter = random.randint(-60, 60)
-        time.sleep(max(60, SLEEP_BETWEEN_CYCLES + jitter))
-
+        if SHUTDOWN.wait(max(60, SLEEP_BETWEEN_CYCLES + jitter)):
+            break
 
-# ─────────────────────────────────────────────
-# CLI: update-existing
-# ─────────────────────────────────────────────
-if len(sys.argv) > 1 and sys.argv[1] == "--update-existing":
-    update_existing_posts()
-    sys.exit(0)
 
 # ─────────────────────────────────────────────
 # ENTRY POINT
 # ─────────────────────────────────────────────
 if __name__ == "__main__":
+    # CLI: update-existing (only when run as a script, never on import)
+    if len(sys.argv) > 1 and sys.argv[1] == "--update-existing":
+        try:
+            update_existing_posts()
+        finally:
+            close_http()
+        sys.exit(0)
+
     log("🔧 reddit → lemmy bridge starting…")
+    signal.signal(signal.SIGTERM, _request_shutdown)
+    signal.signal(signal.SIGINT, _request_shutdown)
 
     conn = sqlite3.connect("data/jobs.db")
     db = JobDB(conn)
@@ -1054,3 +1671,9 @@ if __name__ == "__main__":
         mirror_loop(db)
     except Exception as e:
         log(f"❌ Mirror loop failed: {e}")
+    finally:
+        # Per-item writes skip fsync; make the final state durable on the way out
+        flush_cache(fsync=SAFE_FSYNC)
+        close_http()
+        conn.close()
+        log("👋 Bridge stopped.")
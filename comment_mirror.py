@@ -11,15 +11,24 @@ import os
 import json
 import time
 import argparse
+from collections import deque
 from pathlib import Path
 from typing import Dict, Any, Optional
 
 import requests
 import praw
-from praw.models import Comment
+from praw.models import Comment, MoreComments
 from dotenv import load_dotenv
 
+try:
+    import orjson  # optional: faster parsing of the JSON state files
+except ImportError:
+    orjson = None
+
 from db_cache import DB
+from mirror_media import fsync_dir
+from rate_limiter import get_limiter
+from utils import pooled_session
 
 # --------------------------
 # Config / .env
@@ -40,10 +49,13 @@ DATA_DIR = Path(os.getenv("DATA_DIR", "/app/data"))
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 POST_MAP_FILE = DATA_DIR / "post_map.json"          # legacy (read-only in this branch)
-COMMENT_MAP_FILE = DATA_DIR / "comment_map.json"    # legacy (read-only in this branch)
+COMMENT_MAP_FILE = DATA_DIR / "comment_map.json"    # legacy snapshot; only rewritten by journal compaction
+COMMENT_LOG_FILE = COMMENT_MAP_FILE.with_suffix(".jsonl")  # append-only journal on top of the legacy map
+COMMENT_LOG_COMPACT_EVERY = int(os.getenv("COMMENT_LOG_COMPACT_EVERY", "10000"))  # journal lines before folding
 
 COMMENT_SLEEP = float(os.getenv("COMMENT_SLEEP", "0.3"))
 COMMENT_LIMIT_TOTAL = int(os.getenv("COMMENT_LIMIT_TOTAL", "500"))
+COMMENT_SORT = os.getenv("COMMENT_SORT", "confidence")  # Reddit's default "best" ordering
 
 TOKEN_FILE = Path(os.getenv("TOKEN_FILE_COMMENTS", str(DATA_DIR / "token.json")))
 
@@ -65,10 +77,42 @@ print(f"{'🔁' if REFRESH else '▶️'} comment_mirror.py starting (refresh={R
 # Helpers
 # --------------------------
 
+# Server-advertised budget (X-Ratelimit-* headers); lets us skip COMMENT_SLEEP when quota remains
+RATE_HEADROOM = int(os.getenv("RATE_HEADROOM", "5"))
+_rate_state = {"remaining": None, "reset_at": 0.0}
+
+def note_rate_headers(r) -> None:
+    remaining = r.headers.get("X-Ratelimit-Remaining")
+    if remaining is None:
+        return
+    try:
+        _rate_state["remaining"] = int(float(remaining))
+        _rate_state["reset_at"] = time.monotonic() + float(r.headers.get("X-Ratelimit-Reset", "0"))
+    except ValueError:
+        pass
+
+def rate_pause() -> Optional[float]:
+    """How long to pause before the next call: 0 with budget, exact reset wait when exhausted, else None."""
+    remaining = _rate_state["remaining"]
+    if remaining is None:
+        return None
+    if remaining == 0:
+        return max(0.0, _rate_state["reset_at"] - time.monotonic())
+    return 0.0 if remaining > RATE_HEADROOM else None
+
+# One keep-alive pool for every Lemmy call in this script
+SESSION = pooled_session()
+
+# One shared Bearer header dict, updated in place whenever the JWT changes
+_AUTH_HEADERS: Dict[str, str] = {}
+
+def set_auth_jwt(jwt: str) -> None:
+    _AUTH_HEADERS["Authorization"] = f"Bearer {jwt}"
+
 # Determine whether this Lemmy instance supports 'Old' or 'Oldest' sort key
 LEM_MY_SORT_KEY = None
 
-def detect_lemmy_sort_key(jwt: str) -> str:
+def detect_lemmy_sort_key() -> str:
     """
     Detects whether the connected Lemmy instance expects 'Old' or 'Oldest' for comment sort.
     Caches the result globally to avoid repeated 400 errors.
@@ -79,10 +123,10 @@ def detect_lemmy_sort_key(jwt: str) -> str:
         return LEM_MY_SORT_KEY
 
     test_url = f"{LEMMY_URL}/api/v3/comment/list"
-    params = {"limit": 1, "page": 1, "sort": "Old", "auth": jwt}
+    params = {"limit": 1, "page": 1, "sort": "Old"}
 
     try:
-        resp = requests.get(test_url, params=params, timeout=10)
+        resp = SESSION.get(test_url, params=params, headers=_AUTH_HEADERS, timeout=10)
         if resp.status_code == 400 and "unknown variant" in resp.text:
             print("↩️ Lemmy API does not support 'Old'; falling back to 'Oldest'")
             LEM_MY_SORT_KEY = "Oldest"
@@ -97,17 +141,27 @@ def detect_lemmy_sort_key(jwt: str) -> str:
 def load_json(path: Path, default):
     if path.exists():
         try:
-            with path.open("r", encoding="utf-8") as f:
-                return json.load(f)
+            with path.open("rb") as f:
+                return orjson.loads(f.read()) if orjson is not None else json.load(f)
         except Exception as e:
             print(f"⚠️ Failed to read {path}: {e}. Using default.")
     return default
 
-def save_json(path: Path, obj) -> None:
+def save_json(path: Path, obj, durable: bool = False) -> None:
+    """Atomic tmp + rename. durable=True also fsyncs the file and its directory."""
     tmp = path.with_suffix(".tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
-    tmp.replace(path)
+    if orjson is not None:
+        payload = orjson.dumps(obj)
+    else:
+        payload = json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    with tmp.open("wb") as f:
+        f.write(payload)
+        if durable:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, path)
+    if durable:
+        fsync_dir(path.parent)
 
 def sanitise_markdown(text: str) -> str:
     if text is None:
@@ -150,17 +204,18 @@ def lemmy_login(force: bool = False) -> str:
     for attempt in range(5):
         global LAST_LOGIN_TIME
         if "LAST_LOGIN_TIME" not in globals():
-            LAST_LOGIN_TIME = 0
+            LAST_LOGIN_TIME = float("-inf")
 
-        elapsed = time.time() - LAST_LOGIN_TIME
+        elapsed = time.monotonic() - LAST_LOGIN_TIME
         if elapsed < 60:
             wait = 60 - elapsed
             print(f"⏳ Too soon to log in again. Waiting {wait:.0f}s before retry...")
             time.sleep(wait)
 
-        LAST_LOGIN_TIME = time.time()
+        LAST_LOGIN_TIME = time.monotonic()
         print(f"🔑 Logging in to {url} as {LEMMY_USER} (attempt {attempt + 1}/5)")
-        r = requests.post(url, json=payload, timeout=30)
+        get_limiter("lemmy_login").acquire()
+        r = SESSION.post(url, json=payload, timeout=30)
 
         if r.status_code == 400 and "rate_limit_error" in r.text:
             wait_time = 120 + attempt * 30
@@ -176,12 +231,13 @@ def lemmy_login(force: bool = False) -> str:
             raise RuntimeError("No JWT returned by Lemmy login.")
 
         save_json(TOKEN_FILE, {"jwt": jwt, "cached_at": time.time()})
+        set_auth_jwt(jwt)
         print("✅ Logged into Lemmy (token cached)")
 
         try:
-            user_info = requests.get(
+            user_info = SESSION.get(
                 f"{LEMMY_URL}/api/v3/site",
-                headers={"Authorization": f"Bearer {jwt}"},
+                headers=_AUTH_HEADERS,
                 timeout=15,
             )
             if user_info.ok:
@@ -211,16 +267,17 @@ _token_lock = threading.Lock()
 def get_or_refresh_jwt(force: bool = False) -> str:
     global _jwt_cache
     with _token_lock:
-        now = time.time()
+        now = time.monotonic()  # in-process age only; the token file keeps wall-clock cached_at
         if not isinstance(_jwt_cache, dict):
             _jwt_cache = {"token": None, "timestamp": 0}
         if (not force) and _jwt_cache.get("token") and (now - _jwt_cache.get("timestamp", 0)) < 3600:
-            test = requests.get(
+            test = SESSION.get(
                 f"{LEMMY_URL}/api/v3/site",
                 headers={"Authorization": f"Bearer {_jwt_cache['token']}"},
                 timeout=15,
             )
             if test.ok and "my_user" in test.text:
+                set_auth_jwt(_jwt_cache["token"])
                 return _jwt_cache["token"]
             else:
                 print("⚠️ Cached JWT invalid — forcing refresh")
@@ -228,9 +285,10 @@ def get_or_refresh_jwt(force: bool = False) -> str:
         print("♻️ Refreshing Lemmy JWT (scheduled or forced)...")
         jwt = lemmy_login(force=True)
 
-        verify = requests.get(
+        set_auth_jwt(jwt)
+        verify = SESSION.get(
             f"{LEMMY_URL}/api/v3/site",
-            headers={"Authorization": f"Bearer {jwt}"},
+            headers=_AUTH_HEADERS,
             timeout=15,
         )
         if not verify.ok or "my_user" not in verify.text:
@@ -238,8 +296,9 @@ def get_or_refresh_jwt(force: bool = False) -> str:
             time.sleep(3)
             jwt = lemmy_login(force=True)
 
+        set_auth_jwt(jwt)
         _jwt_cache = {"token": jwt, "timestamp": now}
-        save_json(TOKEN_FILE, {"jwt": jwt, "cached_at": now})
+        # lemmy_login() already persisted this exact token; don't rewrite the file
         print("✅ JWT refreshed and verified")
         return jwt
 
@@ -251,19 +310,19 @@ def get_existing_lemmy_comments(post_id: int) -> Dict[str, int]:
     url = f"{LEMMY_URL}/api/v3/comment/list"
     existing: Dict[str, int] = {}
 
-    sort_value = detect_lemmy_sort_key(jwt)  # detect once and cache globally
+    sort_value = detect_lemmy_sort_key()  # detect once and cache globally
     params = {"post_id": post_id, "sort": sort_value, "limit": 50, "page": 1}
 
     while True:
         try:
-            r = requests.get(url, params=params, timeout=30)
+            r = SESSION.get(url, params=params, timeout=30)
 
             # Fallback for older Lemmy servers that don't support 'Old'
             if r.status_code == 400 and "unknown variant" in r.text and sort_value == "Old":
                 sort_value = "Oldest"
                 params["sort"] = sort_value
                 print(f"↩️ Lemmy API rejected 'Old'; retrying with 'Oldest'")
-                r = requests.get(url, params=params, timeout=30)
+                r = SESSION.get(url, params=params, timeout=30)
 
             if r.status_code != 200:
                 print(f"⚠️ Failed to list comments for post {post_id}: {r.status_code} {r.text}")
@@ -298,11 +357,14 @@ def post_lemmy_comment(jwt: str, post_id: int, content: str, parent_id: Optional
     payload = {"post_id": post_id, "content": content}
     if parent_id is not None:
         payload["parent_id"] = parent_id
-    headers = {"Authorization": f"Bearer {jwt}"}
+    if not _AUTH_HEADERS:
+        set_auth_jwt(jwt)
 
     for attempt in range(1, 4):
         try:
-            r = requests.post(url, json=payload, headers=headers, timeout=30)
+            get_limiter("lemmy_comment").acquire()
+            r = SESSION.post(url, json=payload, headers=_AUTH_HEADERS, timeout=30)
+            note_rate_headers(r)
             if r.status_code == 200:
                 comment_id = r.json().get("comment_view", {}).get("comment", {}).get("id")
                 if comment_id:
@@ -313,14 +375,13 @@ def post_lemmy_comment(jwt: str, post_id: int, content: str, parent_id: Optional
 
             if r.status_code == 401 or "jwt" in r.text.lower() or "login" in r.text.lower():
                 print("🔄 JWT appears invalid — refreshing once...")
-                jwt = get_or_refresh_jwt(force=True)
-                headers = {"Authorization": f"Bearer {jwt}"}
+                get_or_refresh_jwt(force=True)  # rewrites _AUTH_HEADERS in place
                 time.sleep(2)
                 continue
 
             if r.status_code in (400, 429, 502, 503):
                 if "rate_limit_error" in r.text:
-                    wait_time = 60 * attempt
+                    wait_time = rate_pause() or 60 * attempt
                     print(f"⚠️ Lemmy rate limit hit (attempt {attempt}/3). Waiting {wait_time}s...")
                     time.sleep(wait_time)
                     continue
@@ -365,11 +426,95 @@ def load_post_map() -> Dict[str, Any]:
         print(f"ℹ️ No map for posts at {POST_MAP_FILE}. Run auto_mirror.py first.")
     return m
 
-def load_comment_map() -> Dict[str, Dict[str, int]]:
-    return load_json(COMMENT_MAP_FILE, {})
+_journal_lines: Optional[int] = None  # lines in COMMENT_LOG_FILE, known once it has been read
 
-def save_comment_map(comment_map: Dict[str, Dict[str, int]]) -> None:
-    save_json(COMMENT_MAP_FILE, comment_map)  # legacy write maintained (backup)
+def load_comment_map() -> Dict[str, Dict[str, int]]:
+    """Legacy comment_map.json with the append-only journal replayed on top."""
+    global _journal_lines
+    comment_map = load_json(COMMENT_MAP_FILE, {})
+    lines = 0
+    if COMMENT_LOG_FILE.exists():
+        with COMMENT_LOG_FILE.open("rb") as f:
+            for line in f:
+                lines += 1
+                try:
+                    rec = orjson.loads(line) if orjson is not None else json.loads(line)
+                    comment_map.setdefault(rec["p"], {})[rec["r"]] = rec["l"]
+                except (ValueError, KeyError, TypeError):
+                    continue  # torn trailing line after a crash
+    _journal_lines = lines
+    return comment_map
+
+def compact_comment_map() -> None:
+    """Fold the journal into comment_map.json (atomic rename), then truncate it."""
+    global _journal_lines
+    # The snapshot must be on disk before the journal holding the same mappings is emptied
+    save_json(COMMENT_MAP_FILE, load_comment_map(), durable=True)
+    with COMMENT_LOG_FILE.open("wb"):
+        pass
+    _journal_lines = 0
+
+# Mappings added since the last flush; only this delta is ever written out
+_new_since_flush: list[tuple[str, str, int]] = []
+
+def record_comment_mapping(reddit_post_id: str, reddit_comment_id: str, lemmy_comment_id: int) -> None:
+    _new_since_flush.append((reddit_post_id, reddit_comment_id, lemmy_comment_id))
+
+def flush_comment_map() -> None:
+    """Append the pending delta to the journal in one write, then clear it."""
+    if not _new_since_flush:
+        return
+    global _journal_lines
+    dumps = orjson.dumps if orjson is not None else (lambda o: json.dumps(o).encode("utf-8"))
+    payload = b"".join(dumps({"p": p, "r": r, "l": l}) + b"\n" for p, r, l in _new_since_flush)
+    with COMMENT_LOG_FILE.open("ab") as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())  # one fsync per batch keeps the journal durable
+    if _journal_lines is not None:
+        _journal_lines += len(_new_since_flush)
+    _new_since_flush.clear()
+    if _journal_lines is not None and _journal_lines >= COMMENT_LOG_COMPACT_EVERY:
+        compact_comment_map()
+
+def iter_comments_bfs(submission, limit: Optional[int] = None):
+    """
+    Breadth-first walk of a submission's comment tree (parents before children).
+    Stops after `limit` comments; MoreComments stubs are only expanded once the
+    already-loaded comments run out, so a capped walk of a huge thread never
+    pays for replace_more(limit=None).
+    """
+    forests = deque([submission.comments])
+    pending_more = deque()
+    seen = 0
+    while forests or pending_more:
+        if not forests:
+            try:
+                forests.append(pending_more.popleft().comments())
+            except Exception as e:
+                print(f"⚠️ Failed to expand more comments: {e}")
+            continue
+        for c in forests.popleft():
+            if isinstance(c, MoreComments):
+                pending_more.append(c)
+                continue
+            yield c
+            seen += 1
+            if limit is not None and seen >= limit:
+                return
+            if c.replies:
+                forests.append(c.replies)
+
+def fetch_submission(reddit, reddit_post_id: str, limit: Optional[int] = None):
+    """
+    Lazy PRAW submission whose first .comments access asks Reddit for at most
+    `limit` comments in COMMENT_SORT order, so capped walks load one page.
+    """
+    submission = reddit.submission(id=reddit_post_id)
+    submission.comment_sort = COMMENT_SORT
+    if limit is not None:
+        submission.comment_limit = limit
+    return submission
 
 def get_lemmy_post_id(entry: Any) -> Optional[int]:
     if isinstance(entry, int):
@@ -386,9 +531,11 @@ def get_lemmy_post_id(entry: Any) -> Optional[int]:
 # --------------------------
 # Mirroring logic
 # --------------------------
+_DELETED_BODIES = frozenset(("[deleted]", "[removed]"))
+
 def compose_comment_body(c: Comment) -> str:
     body = getattr(c, "body", "") or ""
-    if body in ("[deleted]", "[removed]"):
+    if len(body) < 16 and body in _DELETED_BODIES:
         body = ""
     return f"{author_label(c)}\n\n{sanitise_markdown(body)}".strip()
 
@@ -420,17 +567,16 @@ def mirror_comments_for_post(reddit, jwt, reddit_post_id, lemmy_post_id, comment
     per_post_map = comment_map.setdefault(reddit_post_id, {})
     existing_lemmy_sig = get_existing_lemmy_comments(lemmy_post_id) if REFRESH else {}
 
-    submission = reddit.submission(id=reddit_post_id)
-    submission.comments.replace_more(limit=None)
+    submission = fetch_submission(reddit, reddit_post_id, COMMENT_LIMIT_TOTAL + 1)
 
     def parent_reddit_id(c):
         pid = getattr(c, "parent_id", None) or ""
-        return pid[3:] if pid.startswith("t1_") else None
+        return pid[3:] if pid[:3] == "t1_" else None
 
     temp_parent_map = {**per_post_map}
     mirrored = skipped = total_processed = 0
 
-    for c in submission.comments.list():
+    for c in iter_comments_bfs(submission, COMMENT_LIMIT_TOTAL + 1):
         if total_processed >= COMMENT_LIMIT_TOTAL:
             print(f"⏹️ Reached COMMENT_LIMIT_TOTAL={COMMENT_LIMIT_TOTAL} for {reddit_post_id}")
             break
@@ -454,6 +600,8 @@ def mirror_comments_for_post(reddit, jwt, reddit_post_id, lemmy_post_id, comment
         content_sig = (content[:120]).strip()
         if REFRESH and rid not in per_post_map and content_sig in existing_lemmy_sig:
             per_post_map[rid] = existing_lemmy_sig[content_sig]
+            record_comment_mapping(reddit_post_id, rid, per_post_map[rid])
+            db.save_comment(str(rid), str(per_post_map[rid]), parent_reddit_id(c), None)
             skipped += 1
             continue
 
@@ -471,6 +619,7 @@ def mirror_comments_for_post(reddit, jwt, reddit_post_id, lemmy_post_id, comment
         print(f"💬 Enqueued background job for comment {rid} (post {reddit_post_id} → Lemmy {lemmy_post_id})")
         mirrored += 1
 
+    flush_comment_map()
     print(f"🧮 Done queuing comments for {reddit_post_id}: mirrored={mirrored}, skipped={skipped}")
     return mirrored, skipped
 
@@ -503,8 +652,6 @@ def main():
         m, s = mirror_comments_for_post(reddit, jwt, rp_id, lemmy_post_id, comment_map, db)
         total_mirrored += m
         total_skipped += s
-        # Keep legacy JSON up to date as a backup only
-        save_comment_map(comment_map)
 
     print(f"🧮 Comment mirror complete. Mirrored: {total_mirrored}, Skipped: {total_skipped}")
 
@@ -536,13 +683,12 @@ async def mirror_comment_to_lemmy(payload: dict) -> dict:
 
     print(f"💬 Mirroring comments for Reddit post {reddit_post_id} → Lemmy post {lemmy_post_id}")
 
-    submission = reddit.submission(id=reddit_post_id)
-    submission.comments.replace_more(limit=None)
+    submission = fetch_submission(reddit, reddit_post_id)
 
     mirrored = 0
     skipped = 0
 
-    for c in submission.comments.list():
+    for c in iter_comments_bfs(submission):
         reddit_comment_id = getattr(c, "id", None)
         if not reddit_comment_id:
             continue
@@ -555,10 +701,9 @@ async def mirror_comment_to_lemmy(payload: dict) -> dict:
 
         # ✅ Step 2: Compose comment content
         content = compose_comment_body(c)
-        parent_id = getattr(c, "parent_id", None)
-        parent_lemmy_id = None
-        if parent_id and parent_id.startswith("t1_"):
-            parent_lemmy_id = db.get_lemmy_comment_id(parent_id[3:])
+        parent_id = getattr(c, "parent_id", None) or ""
+        parent_rid = parent_id[3:] if parent_id[:3] == "t1_" else None
+        parent_lemmy_id = db.get_lemmy_comment_id(parent_rid) if parent_rid else None
 
         # ✅ Step 3: Post to Lemmy
         lemmy_comment_id = post_lemmy_comment(jwt, int(lemmy_post_id), content, parent_lemmy_id)
@@ -568,7 +713,7 @@ async def mirror_comment_to_lemmy(payload: dict) -> dict:
             db.save_comment(
                 reddit_comment_id,
                 str(lemmy_comment_id),
-                parent_id[3:] if parent_id and parent_id.startswith("t1_") else None,
+                parent_rid,
                 str(parent_lemmy_id) if parent_lemmy_id else None,
             )
             print(f"✅ Mirrored Reddit comment {reddit_comment_id} → Lemmy {lemmy_comment_id}")
@@ -576,8 +721,12 @@ async def mirror_comment_to_lemmy(payload: dict) -> dict:
         else:
             print(f"⚠️ Failed to mirror comment {reddit_comment_id}")
 
-        import random
-        await asyncio.sleep(COMMENT_SLEEP + random.uniform(0, 2))
+        pause = rate_pause()
+        if pause is None:
+            import random
+            pause = COMMENT_SLEEP + random.uniform(0, 2)
+        if pause:
+            await asyncio.sleep(pause)
 
     print(f"✅ Completed comment mirror for Reddit post {reddit_post_id}: {mirrored} new, {skipped} skipped.")
     return {"mirrored": mirrored, "skipped": skipped}
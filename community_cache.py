@@ -9,6 +9,11 @@ from typing import Dict, Optional
 
 import requests
 
+try:
+    import orjson  # optional: faster cache file (de)serialization
+except ImportError:
+    orjson = None
+
 CACHE_FILENAME = "community_map.json"
 CACHE_TTL_SECS = 6 * 60 * 60  # 6 hours
 
@@ -23,7 +28,8 @@ class CommunityCache:
 
     def load_disk(self) -> bool:
         try:
-            data = json.loads(self.path.read_text(encoding="utf-8"))
+            raw = self.path.read_bytes()
+            data = orjson.loads(raw) if orjson is not None else json.loads(raw)
             self.by_exact = data.get("by_exact", {})
             self.by_lower = data.get("by_lower", {})
             self.loaded_at = data.get("loaded_at", 0.0)
@@ -38,7 +44,10 @@ class CommunityCache:
             "loaded_at": self.loaded_at,
         }
         tmp = self.path.with_suffix(".tmp")
-        tmp.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+        if orjson is not None:
+            tmp.write_bytes(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+        else:
+            tmp.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
         tmp.replace(self.path)
 
     def fresh(self) -> bool:
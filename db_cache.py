@@ -2,7 +2,7 @@ import sqlite3
 import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable
 import os
 
 # Use DATA_DIR for container-friendly persistence
@@ -18,16 +18,39 @@ class DB:
     """
 
     _lock = threading.Lock()
+    # One connection per database file, shared by every DB() in the process and
+    # serialized by _lock: no reconnect per call, and its statement cache stays warm.
+    _conns: Dict[str, sqlite3.Connection] = {}
 
     def __init__(self, db_path: Optional[str] = None):
         self.db_path = str(db_path) if db_path else str(DB_PATH)
-        self._init_db()
+        with self._lock:
+            if self.db_path not in self._conns:
+                try:
+                    self._init_db()
+                except Exception:
+                    self._conns.pop(self.db_path, None)
+                    raise
 
     def _get_conn(self):
-        """Return a new SQLite connection with foreign keys enabled."""
-        conn = sqlite3.connect(self.db_path, check_same_thread=False)
-        conn.row_factory = sqlite3.Row
-        conn.execute("PRAGMA foreign_keys = ON;")
+        """Return the shared SQLite connection for this file, opening it on first use."""
+        conn = self._conns.get(self.db_path)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            # WAL: readers never block on the mirror's writes. synchronous=NORMAL:
+            # fsync at checkpoints, not every commit (WAL stays crash-consistent).
+            # cache_size is in KiB when negative (64 MiB page cache); mmap_size lets
+            # reads come straight from the OS page cache (256 MiB window).
+            conn.executescript("""
+                PRAGMA foreign_keys = ON;
+                PRAGMA journal_mode = WAL;
+                PRAGMA synchronous = NORMAL;
+                PRAGMA temp_store = MEMORY;
+                PRAGMA cache_size = -65536;
+                PRAGMA mmap_size = 268435456;
+            """)
+            self._conns[self.db_path] = conn
         return conn
 
     # ─────────────────────────────── DB Initialization ─────────────────────────────── #
@@ -46,6 +69,13 @@ class DB:
                     last_synced TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 );
             """)
+            # body_hash: digest of the last title/body/url pushed by --update-existing
+            post_cols = {r["name"] for r in conn.execute("PRAGMA table_info(posts);")}
+            if "body_hash" not in post_cols:
+                conn.execute("ALTER TABLE posts ADD COLUMN body_hash TEXT;")
+            # reddit_fetched_at: epoch seconds of the last Reddit fetch by --update-existing
+            if "reddit_fetched_at" not in post_cols:
+                conn.execute("ALTER TABLE posts ADD COLUMN reddit_fetched_at REAL;")
 
             # comments table
             conn.execute("""
@@ -96,6 +126,19 @@ class DB:
                 VALUES (?, ?, ?, ?, ?)
             """, (reddit_id, lemmy_id, subreddit, source, datetime.utcnow()))
 
+    def save_posts_bulk(self, rows: Iterable[tuple[str, str, Optional[str]]]) -> int:
+        """
+        Insert (reddit_id, lemmy_id, subreddit) rows in one transaction.
+        Accepts any iterable (a generator is consumed lazily).
+        Existing reddit_ids are left untouched. Returns the number inserted.
+        """
+        with self._lock, self._get_conn() as conn, conn:
+            cur = conn.executemany(
+                "INSERT OR IGNORE INTO posts (reddit_id, lemmy_id, subreddit) VALUES (?, ?, ?);",
+                rows,
+            )
+            return cur.rowcount
+
     def get_lemmy_post_id(self, reddit_id: str) -> Optional[str]:
         with self._lock, self._get_conn() as conn:
             row = conn.execute("SELECT lemmy_id FROM posts WHERE reddit_id = ?;", (reddit_id,)).fetchone()
@@ -106,6 +149,29 @@ class DB:
             row = conn.execute("SELECT reddit_id FROM posts WHERE lemmy_id = ?;", (lemmy_id,)).fetchone()
             return row["reddit_id"] if row else None
 
+    def get_post_update_state(self) -> Dict[str, tuple[Optional[str], Optional[float]]]:
+        """Return {reddit_id: (body_hash, reddit_fetched_at)} for posts --update-existing has seen."""
+        with self._lock, self._get_conn() as conn:
+            rows = conn.execute(
+                "SELECT reddit_id, body_hash, reddit_fetched_at FROM posts "
+                "WHERE body_hash IS NOT NULL OR reddit_fetched_at IS NOT NULL;"
+            ).fetchall()
+            return {r["reddit_id"]: (r["body_hash"], r["reddit_fetched_at"]) for r in rows}
+
+    def save_post_update_state(self, rows: Iterable[tuple[str, str, Optional[str], float]]):
+        """
+        Upsert (reddit_id, lemmy_id, body_hash, reddit_fetched_at) rows in one transaction.
+        Ids only known from the legacy post_map get a posts row; a None hash keeps the stored one.
+        """
+        with self._lock, self._get_conn() as conn, conn:
+            conn.executemany("""
+                INSERT INTO posts (reddit_id, lemmy_id, body_hash, reddit_fetched_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(reddit_id) DO UPDATE SET
+                    body_hash = COALESCE(excluded.body_hash, posts.body_hash),
+                    reddit_fetched_at = excluded.reddit_fetched_at;
+            """, rows)
+
     # ─────────────────────────────── Ignored Post Helpers ─────────────────────────────── #
     def mark_post_ignored(self, reddit_id: str, reason: str = "forbidden"):
         """Mark a Reddit post as permanently ignored (deleted/forbidden)."""
@@ -210,6 +276,12 @@ class DB:
             rows = conn.execute(query, (window,)).fetchall()
             return [(r["reddit_id"], r["lemmy_id"]) for r in rows]
 
+    def get_all_posts(self) -> list[tuple[str, str]]:
+        """Return (reddit_id, lemmy_id) for every mirrored post."""
+        with self._lock, self._get_conn() as conn:
+            rows = conn.execute("SELECT reddit_id, lemmy_id FROM posts;").fetchall()
+            return [(r["reddit_id"], r["lemmy_id"]) for r in rows]
+
 if __name__ == "__main__":
     db = DB()
     db.save_post("r_demo", "l_123", "testsub", source="reddit")
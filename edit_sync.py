@@ -1,7 +1,14 @@
 #!/usr/bin/env python3
-import os, time, json, requests
+import os, time, json
 from datetime import datetime, timezone
 
+from utils import pooled_session
+
+try:
+    import orjson  # optional: faster JSON for the cache files
+except ImportError:
+    orjson = None
+
 LEMMY_INSTANCE = os.getenv("LEMMY_INSTANCE", "http://lemmy:8536").rstrip("/")
 LEMMY_USER = os.getenv("LEMMY_USER")
 LEMMY_PASS = os.getenv("LEMMY_PASS")
@@ -14,21 +21,30 @@ DATA_DIR = "data"
 TOKEN_CACHE = os.path.join(DATA_DIR, "token.json")
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Keep-alive pool shared by every Lemmy/Reddit call below
+SESSION = pooled_session()
+
 def log(msg): print(msg, flush=True)
 def load_json(path, default=None):
     if os.path.exists(path):
-        try: return json.load(open(path))
+        try:
+            with open(path, "rb") as f:
+                return orjson.loads(f.read()) if orjson is not None else json.load(f)
         except: pass
     return default if default is not None else {}
-def save_json(path, data): json.dump(data, open(path, "w"))
+def save_json(path, data):
+    tmp = f"{path}.tmp"
+    payload = orjson.dumps(data) if orjson is not None else json.dumps(data).encode("utf-8")
+    with open(tmp, "wb") as f: f.write(payload)
+    os.replace(tmp, path)
 
 def get_lemmy_token():
     cache = load_json(TOKEN_CACHE)
     if cache and "jwt" in cache and (time.time() - cache.get("timestamp", 0) < 3600):
         return cache["jwt"]
     log(f"🔑 Logging in to {LEMMY_INSTANCE}/api/v3/user/login as {LEMMY_USER}")
-    r = requests.post(f"{LEMMY_INSTANCE}/api/v3/user/login",
-                      json={"username_or_email": LEMMY_USER, "password": LEMMY_PASS}, timeout=10)
+    r = SESSION.post(f"{LEMMY_INSTANCE}/api/v3/user/login",
+                     json={"username_or_email": LEMMY_USER, "password": LEMMY_PASS}, timeout=10)
     if r.status_code != 200 or "jwt" not in r.json():
         raise SystemExit(f"❌ Lemmy login failed: {r.text}")
     jwt = r.json()["jwt"]
@@ -39,29 +55,29 @@ def get_lemmy_token():
 def fetch_reddit_post(subreddit, post_id):
     url = f"https://www.reddit.com/r/{subreddit}/comments/{post_id}.json"
     headers = {"User-Agent": "reddit-lemmy-bridge"}
-    r = requests.get(url, headers=headers, timeout=15)
+    r = SESSION.get(url, headers=headers, timeout=15)
     if r.status_code != 200:
         return None
     data = r.json()[0]["data"]["children"][0]["data"]
     return data
 
 def update_lemmy_post(post_id, body, title, token): # Added title param
-    r = requests.put(f"{LEMMY_INSTANCE}/api/v3/post",
-                     headers={"Authorization": f"Bearer {token}"},
-                     json={
-                         "post_id": post_id, 
-                         "body": body,
-                         "name": title # This fixes the 'missing field name' error
-                     }, timeout=10)
+    r = SESSION.put(f"{LEMMY_INSTANCE}/api/v3/post",
+                    headers={"Authorization": f"Bearer {token}"},
+                    json={
+                        "post_id": post_id, 
+                        "body": body,
+                        "name": title # This fixes the 'missing field name' error
+                    }, timeout=10)
     if r.status_code == 200:
         log(f"✅ Updated Lemmy post {post_id}")
     else:
         log(f"⚠️ Lemmy post update failed ({r.status_code}): {r.text}")
 
 def update_lemmy_comment(comment_id, body, token):
-    r = requests.put(f"{LEMMY_INSTANCE}/api/v3/comment/update",
-                     headers={"Authorization": f"Bearer {token}"},
-                     json={"comment_id": comment_id, "content": body}, timeout=10)
+    r = SESSION.put(f"{LEMMY_INSTANCE}/api/v3/comment/update",
+                    headers={"Authorization": f"Bearer {token}"},
+                    json={"comment_id": comment_id, "content": body}, timeout=10)
     if r.status_code == 200:
         log(f"✅ Updated Lemmy comment {comment_id}")
     else:
@@ -3,12 +3,13 @@ import re
 IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".gif", ".webp")
 VIDEO_DOMAINS = ("youtube.com", "youtu.be", "vimeo.com", "reddit.com/video")
 
+_URL_RE = re.compile(r"https?://\S+")
+# All VIDEO_DOMAINS in one alternation: a single scan per URL instead of one per domain
+_VIDEO_RE = re.compile("|".join(re.escape(d) for d in VIDEO_DOMAINS), re.I)
+
 def extract_media_links(text):
     """Return a list of media URLs (images/videos) found in the comment text."""
-    urls = re.findall(r"https?://\S+", text)
-    media = []
-    for url in urls:
-        lower = url.lower()
-        if lower.endswith(IMAGE_EXTS) or any(d in lower for d in VIDEO_DOMAINS):
-            media.append(url)
-    return media
+    return [
+        url for url in _URL_RE.findall(text)
+        if url.lower().endswith(IMAGE_EXTS) or _VIDEO_RE.search(url)
+    ]
@@ -1,6 +1,6 @@
 from __future__ import annotations
 import asyncio
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable
 from worker_manager import WorkerManager
 import os
 import sqlite3
@@ -40,6 +40,16 @@ import sqlite3
 from datetime import datetime
 from pathlib import Path
 
+# Fixed SQL strings so sqlite3's per-connection statement cache reuses the prepared plan
+_INSERT_JOB_SQL = (
+    "INSERT INTO jobs (type, payload, status, retries, created_at, updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+_POST_JOBS_EXISTING_SQL = (
+    "SELECT json_extract(payload, '$.reddit_post_id') FROM jobs "
+    "WHERE type='mirror_post' AND json_extract(payload, '$.reddit_post_id') IN ({})"
+)
+
 
 class JobDB:
     """
@@ -51,7 +61,7 @@ class JobDB:
     def __init__(self, conn: Optional[sqlite3.Connection] = None):
         if conn is None:
             db_path = Path(__file__).parent / "data" / "jobs.db"
-            conn = sqlite3.connect(db_path)
+            conn = sqlite3.connect(db_path, cached_statements=256)
 
         self.conn = conn
         self.cursor = conn.cursor()
@@ -62,6 +72,7 @@ class JobDB:
     # ------------------------------------------------------------
     def _init_schema(self) -> None:
         """Ensure all required tables exist."""
+        self.conn.execute("PRAGMA mmap_size = 268435456")
         self.conn.execute("""
             CREATE TABLE IF NOT EXISTS posts (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -94,6 +105,13 @@ class JobDB:
             )
         """)
 
+        # Partial expression index so the mirror_post dedup lookup is an index probe, not a full scan
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_jobs_reddit_post_id
+            ON jobs (json_extract(payload, '$.reddit_post_id'))
+            WHERE type = 'mirror_post'
+        """)
+
         self.conn.commit()
 
     # ------------------------------------------------------------
@@ -173,24 +191,29 @@ class JobDB:
     # ------------------------------------------------------------
     def enqueue(self, job_type: str, payload: dict, status: str = "queued") -> None:
         """Add a new background job to the queue."""
-        now = datetime.utcnow().isoformat()
-        self.conn.execute(
-            """
-            INSERT INTO jobs (type, payload, status, retries, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """,
-            (
-                job_type,
-                json.dumps(payload),
-                status,
-                0,
-                now,
-                now,
-            ),
-        )
-        self.conn.commit()
+        self.enqueue_many(job_type, [payload], status)
         print(f"✅ Enqueued job type={job_type} ({payload})")
 
+    def enqueue_many(self, job_type: str, payloads: Iterable[dict], status: str = "queued") -> int:
+        """Add several jobs of one type in a single executemany + commit. Returns the count."""
+        now = datetime.utcnow().isoformat()
+        rows = [(job_type, json.dumps(p), status, 0, now, now) for p in payloads]
+        if not rows:
+            return 0
+        with self.conn:
+            self.conn.executemany(_INSERT_JOB_SQL, rows)
+        return len(rows)
+
+    def post_jobs_existing(self, reddit_post_ids: list[str]) -> set[str]:
+        """Return the subset of Reddit post IDs that already have a mirror_post job (one query)."""
+        if not reddit_post_ids:
+            return set()
+        placeholders = ",".join("?" * len(reddit_post_ids))
+        rows = self.conn.execute(
+            _POST_JOBS_EXISTING_SQL.format(placeholders), reddit_post_ids
+        ).fetchall()
+        return {r[0] for r in rows}
+
     # ------------------------------------------------------------
     # 🧩 Legacy compatibility
     # ------------------------------------------------------------
@@ -12,12 +12,11 @@ import os
 import re
 import time
 import random
-import requests
 import praw
 from prawcore.exceptions import RequestException, ResponseException, Forbidden
 
 from db_cache import DB
-from utils import get_valid_token, log, log_error
+from utils import LEMMY_SESSION, get_valid_token, log, log_error
 from auto_backfill import is_first_run, mark_backfill_complete
 from mirror_media import find_urls, mirror_url
 
@@ -106,7 +105,7 @@ def fetch_recent_lemmy_comments(jwt, limit=LEMMY_COMMENT_FETCH_LIMIT):
     try:
         url = f"{LEMMY_URL}/api/v3/comment/list"
         params = {"sort": "New", "limit": limit, "page": 1, "auth": jwt}
-        r = requests.get(url, params=params, timeout=20)
+        r = LEMMY_SESSION.get(url, params=params, timeout=20)
         r.raise_for_status()
         return r.json().get("comments", [])
     except Exception as e:
@@ -8,37 +8,81 @@ Goals:
 - Rehost images to Lemmy Pictrs when feasible (stable, cached, throttled)
 - Rehost *some* videos (v.redd.it / direct mp4/webm) when feasible
 - Treat YouTube/large/long videos as external links (avoid yt-dlp JS runtime issues)
-- Persistent cache (DATA_DIR/media_cache.json) to avoid duplicate uploads
+- Persistent cache (DATA_DIR/media_cache.json snapshot + media_cache.ndjson
+  append log) to avoid duplicate uploads
 - Avoid hammering pictrs / nginx with bridge-side throttling + retries
 """
 
 from __future__ import annotations
 
+import atexit
+import functools
 import json
 import os
 import random
 import re
+import sys
+import threading
 import time
 from dataclasses import dataclass
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import Optional, Tuple
+from urllib.parse import urlsplit
 
 import requests
 import subprocess
 
-# Pull shared helpers if available; fall back gracefully if not.
 try:
-    from auto_mirror import is_image_url, guess_imgur_direct, log  # type: ignore
-except Exception:
-    def is_image_url(u: str) -> bool:
-        return bool(re.search(r"\.(png|jpe?g|gif|webp)(\?.*)?$", u or "", re.I))
+    import orjson  # optional: much faster (de)serialization of the media cache
+except ImportError:
+    orjson = None
+
+# Shared helpers live here (auto_mirror imports them) so neither module has to
+# import the other: importing auto_mirror from here re-executed it as a second
+# module with its own token/state whenever it was run as a script.
+# (epoch second, formatted prefix): the timestamp is only re-formatted once per second
+_log_ts: Tuple[int, str] = (0, "")
+
+
+def log(msg: str):
+    # Console-friendly timestamp + flush
+    global _log_ts
+    now = int(time.time())
+    sec, prefix = _log_ts
+    if now != sec:
+        prefix = f"{datetime.fromtimestamp(now, timezone.utc).isoformat()} | "
+        _log_ts = (now, prefix)
+    sys.stdout.write(f"{prefix}{msg}\n")
+    sys.stdout.flush()
+
+
+def fsync_dir(path) -> None:
+    """fsync a directory so a rename inside it survives a power loss (no-op where unsupported)."""
+    flag = getattr(os, "O_DIRECTORY", None)
+    if flag is None:
+        return
+    fd = os.open(path, os.O_RDONLY | flag)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
 
-    def guess_imgur_direct(u: str):
-        m = re.match(r"https?://(www\.)?imgur\.com/([A-Za-z0-9]+)$", u or "", re.I)
-        return f"https://i.imgur.com/{m.group(2)}.jpg" if m else None
 
-    def log(msg: str):
-        print(msg, flush=True)
+# Image check and imgur page detection in one pass: an imgur page (group "imgur") or an image extension
+_IMAGE_OR_IMGUR_RE = re.compile(
+    r"^https?://(?:www\.)?imgur\.com/(?P<imgur>[A-Za-z0-9]+)$|\.(?:png|jpe?g|gif|webp)(?:\?.*)?$", re.I
+)
+
+
+# URL classification is pure, and the same URLs recur across posts and cycles
+@functools.lru_cache(maxsize=4096)
+def _image_target(u: str) -> Tuple[bool, Optional[str]]:
+    """(is an image/imgur URL, i.imgur.com direct URL if it is an imgur page)."""
+    m = _IMAGE_OR_IMGUR_RE.search(u)
+    if not m:
+        return False, None
+    return True, (f"https://i.imgur.com/{m['imgur']}.jpg" if m["imgur"] else None)
 
 # Try to import Lemmy token logic
 try:
@@ -58,11 +102,16 @@ DATA_DIR.mkdir(parents=True, exist_ok=True)
 #     "<src_url>": {"mirrored": "<pictrs_or_external>", "ts": <unix>, "status": "ok|fail", "reason": "..."}
 #   }
 CACHE_PATH = DATA_DIR / "media_cache.json"
+# New entries are appended here as one [url, entry] JSON array per line and
+# folded into CACHE_PATH once the log grows past MEDIA_CACHE_COMPACT_EVERY lines
+CACHE_LOG_PATH = DATA_DIR / "media_cache.ndjson"
 
 # Defaults (override in .env)
 MEDIA_CACHE_TTL_SECS = int(os.getenv("MEDIA_CACHE_TTL_SECS", str(14 * 24 * 3600)))  # 14 days
 MAX_MEDIA_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(500 * 1024 * 1024)))          # 500 MB
 MIN_UPLOAD_INTERVAL_SECS = float(os.getenv("MIN_UPLOAD_INTERVAL_SECS", "0.6"))
+MEDIA_CACHE_FLUSH_EVERY = int(os.getenv("MEDIA_CACHE_FLUSH_EVERY", "10"))  # cache writes batched per N updates
+MEDIA_CACHE_COMPACT_EVERY = int(os.getenv("MEDIA_CACHE_COMPACT_EVERY", "5000"))  # log lines before compaction
 
 UPLOAD_RETRY_MAX = int(os.getenv("UPLOAD_RETRY_MAX", "4"))
 UPLOAD_RETRY_BASE_SECS = float(os.getenv("UPLOAD_RETRY_BASE_SECS", "2.0"))
@@ -79,15 +128,32 @@ FAIL_PERSIST_SECS = int(os.getenv("MEDIA_FAIL_PERSIST_SECS", str(45 * 24 * 3600)
 # Video policy:
 # - EXTERNAL_ONLY: YouTube, rumble, odysee, etc. (no yt-dlp)
 # - TRY_REHOST: v.redd.it or direct .mp4/.webm URLs
-EXTERNAL_VIDEO_DOMAINS = (
+EXTERNAL_VIDEO_DOMAINS = frozenset((
     "youtube.com", "youtu.be", "rumble.com", "odysee.com", "vimeo.com",
     "streamable.com", "twitch.tv", "kick.com"
-)
+))
+
+
+def _url_host(url: str) -> str:
+    """Lower-cased hostname of a URL ('' if it has none)."""
+    try:
+        return urlsplit(url).hostname or ""
+    except ValueError:
+        return ""
+
+
+def _host_in(host: str, domains: frozenset) -> bool:
+    """Exact hostname or one-label subdomain (www., m., clips., …) match."""
+    return host in domains or host.partition(".")[2] in domains
 
 _url_re = re.compile(r"https?://\S+")
 
 _session: Optional[requests.Session] = None
-_last_upload_ts = 0.0
+_session_lock = threading.Lock()
+_last_upload_ts = float("-inf")
+# Held across the whole wait so concurrent callers (update body pool) queue up
+# behind each other instead of computing the same wait and uploading together
+_upload_lock = threading.Lock()
 
 
 @dataclass(frozen=True)
@@ -100,11 +166,12 @@ class MirrorResult:
 
 def _get_session() -> requests.Session:
     global _session
-    if _session is None:
-        s = requests.Session()
-        s.headers.update({"User-Agent": "reddit-lemmy-bridge/1.0"})
-        _session = s
-    return _session
+    with _session_lock:
+        if _session is None:
+            s = requests.Session()
+            s.headers.update({"User-Agent": "reddit-lemmy-bridge/1.0"})
+            _session = s
+        return _session
 
 
 def find_urls(text: str) -> list[str]:
@@ -156,28 +223,117 @@ def _jpeg_has_eoi(data: bytes) -> bool:
     return len(data) >= 2 and data[-2:] == b"\xff\xd9"
 
 
-def _load_cache() -> dict:
-    if not CACHE_PATH.exists():
-        return {}
-    try:
-        with open(CACHE_PATH, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return {}
+def _loads(data):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
 
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
 
-def _save_cache(cache: dict) -> None:
+
+def _load_cache() -> dict:
+    """Snapshot file with the append log replayed on top (later lines win)."""
+    global _log_lines
+    cache: dict = {}
+    if CACHE_PATH.exists():
+        try:
+            with open(CACHE_PATH, "rb") as f:
+                cache = _loads(f.read())
+        except Exception:
+            cache = {}
+
+    lines = 0
+    if CACHE_LOG_PATH.exists():
+        with open(CACHE_LOG_PATH, "rb") as f:
+            for line in f:
+                lines += 1
+                try:
+                    url, ent = _loads(line)
+                    cache[url] = ent
+                except Exception:
+                    continue  # torn tail from a crash mid-append
+    _log_lines = lines
+    return cache
+
+
+def _save_cache(cache: dict, fsync: bool = False) -> None:
     tmp = CACHE_PATH.with_suffix(".tmp")
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(cache, f, indent=2, sort_keys=True)
-        f.flush()
-        os.fsync(f.fileno())
-    tmp.replace(CACHE_PATH)
+    payload = _dumps(cache)
+    with open(tmp, "wb") as f:
+        f.write(payload)
+        # No fsync per update: the rename alone keeps the file "old or new", and a
+        # lost cache entry only costs a re-upload check
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp, CACHE_PATH)
+    if fsync:
+        fsync_dir(CACHE_PATH.parent)
+
+
+# In-memory view of the cache (loaded once) plus entries not yet written to disk.
+_cache_mem: Optional[dict] = None
+_cache_dirty: dict = {}
+_cache_lock = threading.Lock()
+_log_lines = 0  # lines currently in CACHE_LOG_PATH
+
+
+def _cache() -> dict:
+    """Lazily loaded cache dict. Caller holds _cache_lock."""
+    global _cache_mem
+    if _cache_mem is None:
+        _cache_mem = _load_cache()
+    return _cache_mem
+
+
+def _compact_cache(fsync: bool = False) -> None:
+    """Fold the append log into the snapshot. Caller holds _cache_lock."""
+    global _cache_mem, _log_lines
+    merged = _load_cache()  # includes other processes' appended entries
+    _save_cache(merged, fsync=fsync)
+    # An entry appended by another process between the load and this truncate
+    # is lost; that only costs a re-upload check, never a wrong mapping.
+    with open(CACHE_LOG_PATH, "wb"):
+        pass
+    _cache_mem = merged
+    _log_lines = 0
+
+
+def flush_cache(fsync: bool = False) -> None:
+    """Append pending entries to the cache log; O_APPEND keeps other processes' lines intact."""
+    global _log_lines
+    with _cache_lock:
+        if not _cache_dirty:
+            return
+        payload = b"".join(_dumps([url, ent]) + b"\n" for url, ent in _cache_dirty.items())
+        with open(CACHE_LOG_PATH, "ab") as f:
+            f.write(payload)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        _log_lines += len(_cache_dirty)
+        _cache_dirty.clear()
+        if _log_lines >= MEDIA_CACHE_COMPACT_EVERY:
+            _compact_cache(fsync=fsync)
+
+
+atexit.register(flush_cache)
+
+
+def _cache_put(url: str, ent: dict) -> None:
+    with _cache_lock:
+        _cache()[url] = ent
+        _cache_dirty[url] = ent
+        pending = len(_cache_dirty)
+    if pending >= MEDIA_CACHE_FLUSH_EVERY:
+        flush_cache()
 
 
 def _cache_get(url: str) -> Optional[dict]:
-    cache = _load_cache()
-    ent = cache.get(url)
+    with _cache_lock:  # the first call loads the cache; don't let two threads race it
+        ent = _cache().get(url)
     if not ent:
         return None
     ts = float(ent.get("ts") or 0)
@@ -193,15 +349,11 @@ def _cache_get(url: str) -> Optional[dict]:
 
 
 def _cache_set_ok(url: str, mirrored: str) -> None:
-    cache = _load_cache()
-    cache[url] = {"mirrored": mirrored, "ts": time.time(), "status": "ok"}
-    _save_cache(cache)
+    _cache_put(url, {"mirrored": mirrored, "ts": time.time(), "status": "ok"})
 
 
 def _cache_set_fail(url: str, reason: str) -> None:
-    cache = _load_cache()
-    cache[url] = {"mirrored": "", "ts": time.time(), "status": "fail", "reason": reason[:200]}
-    _save_cache(cache)
+    _cache_put(url, {"mirrored": "", "ts": time.time(), "status": "fail", "reason": reason[:200]})
 
 
 def _get_lemmy_jwt() -> Optional[str]:
@@ -229,14 +381,17 @@ def _throttle_upload() -> None:
     global _last_upload_ts
     if MIN_UPLOAD_INTERVAL_SECS <= 0:
         return
-    now = time.time()
-    wait = (_last_upload_ts + MIN_UPLOAD_INTERVAL_SECS) - now
-    if wait > 0:
-        time.sleep(wait)
-    _last_upload_ts = time.time()
+    with _upload_lock:
+        now = time.monotonic()
+        wait = (_last_upload_ts + MIN_UPLOAD_INTERVAL_SECS) - now
+        if wait > 0:
+            time.sleep(wait)
+        _last_upload_ts = time.monotonic()
+
+_V_REDD_IT_RE = re.compile(r"^https?://v\.redd\.it/([^/?#]+)/?", re.I)
 
 def _resolve_v_redd_it(url: str) -> Optional[str]:
-    m = re.match(r"^https?://v\.redd\.it/([^/?#]+)/?", url or "", re.I)
+    m = _V_REDD_IT_RE.match(url or "")
     if not m:
         return None
 
@@ -414,6 +569,8 @@ def mirror_url(url: str) -> Optional[str]:
         return None
         
     lower = url.lower()
+    host = _url_host(url)
+    is_v_reddit = host == "v.redd.it"
     src_url = url
 
     # 1. Cache Check
@@ -425,7 +582,7 @@ def mirror_url(url: str) -> Optional[str]:
                 return mirrored
         else:
             reason = (ent.get("reason") or "")
-            if "v.redd.it" in lower and reason == "fetch_failed_or_html":
+            if is_v_reddit and reason == "fetch_failed_or_html":
                 pass  # retry v.redd.it if it previously failed resolution
             else:
                 return None
@@ -437,22 +594,20 @@ def mirror_url(url: str) -> Optional[str]:
 
     # 3. YouTube/External Link Handling
     # We check this BEFORE trying to download/upload
-    if any(dom in lower for dom in EXTERNAL_VIDEO_DOMAINS):
+    if _host_in(host, EXTERNAL_VIDEO_DOMAINS):
         md = f"[Video]({url})"
         _cache_set_ok(url, md)
         return md
 
     # 4. Identification & Normalization
-    is_v_reddit = "v.redd.it" in lower
     is_direct_video = lower.endswith((".mp4", ".webm", ".mov"))
-    is_img = is_image_url(url) or bool(guess_imgur_direct(url))
+    is_img, direct_imgur = _image_target(url)
 
     # If it's none of these, we don't know how to mirror it
     if not (is_v_reddit or is_direct_video or is_img):
         return None
 
     # Imgur normalization
-    direct_imgur = guess_imgur_direct(url)
     if direct_imgur:
         url = direct_imgur
 
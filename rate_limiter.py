@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+rate_limiter.py — proactive sliding-window rate limiting shared across modules
+
+Instead of firing a request and sleeping only after Lemmy/Reddit answer with a
+rate-limit error, callers ask the limiter first and wait locally until the
+window has room. One limiter per bucket name is shared process-wide.
+
+Bucket sizes can be overridden with RATE_LIMIT_<NAME>="<limit>/<window_secs>",
+e.g. RATE_LIMIT_LEMMY_COMMENT="30/60".
+
+When a server pushes back anyway (429 / rate_limit_error), backoff_delay()
+gives the wait: the server's Retry-After if it sent one, else capped
+exponential backoff with jitter.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+
+# Default buckets (limit, window seconds)
+DEFAULT_LIMITS = {
+    "lemmy_post": (6, 60.0),
+    "lemmy_comment": (30, 60.0),
+    "lemmy_login": (2, 60.0),
+    "lemmy_update": (60, 60.0),
+    "reddit": (60, 60.0),
+}
+
+
+class RateLimiter:
+    """Sliding-window limiter: at most `limit` requests in any `window` seconds."""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = max(1, int(limit))
+        self.window = float(window)
+        self.requests: deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _cleanup(self, now: float) -> None:
+        cutoff = now - self.window
+        while self.requests and self.requests[0] <= cutoff:
+            self.requests.popleft()
+
+    def can_make_request(self) -> bool:
+        with self._lock:
+            self._cleanup(time.monotonic())
+            return len(self.requests) < self.limit
+
+    def try_request(self) -> bool:
+        """Record a request if the window has room. Returns False if denied."""
+        with self._lock:
+            now = time.monotonic()
+            self._cleanup(now)
+            if len(self.requests) < self.limit:
+                self.requests.append(now)
+                return True
+            return False
+
+    def time_until_next_request(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._cleanup(now)
+            if len(self.requests) < self.limit:
+                return 0.0
+            return max(0.0, self.requests[0] + self.window - now)
+
+    def acquire(self) -> None:
+        """Block until a request slot is available, then record it."""
+        while not self.try_request():
+            time.sleep(max(0.05, self.time_until_next_request()))
+
+    async def acquire_async(self) -> None:
+        """acquire() for coroutines: waits on the event loop instead of parking a thread."""
+        while not self.try_request():
+            await asyncio.sleep(max(0.05, self.time_until_next_request()))
+
+
+def retry_after_secs(headers) -> float | None:
+    """Numeric Retry-After header in seconds, or None (HTTP-date form is ignored)."""
+    raw = headers.get("Retry-After") if headers is not None else None
+    if not raw:
+        return None
+    try:
+        return max(0.0, float(raw))
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 2.0, cap: float = 60.0,
+                  jitter: float = 1.0, retry_after: float | None = None) -> float:
+    """Seconds to wait before retry `attempt` (0-based). A server-sent Retry-After wins."""
+    if retry_after is not None:
+        return retry_after
+    return min(cap, base * (2 ** attempt)) + random.random() * jitter
+
+
+_limiters: dict[str, RateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def _limits_for(name: str) -> tuple[int, float]:
+    limit, window = DEFAULT_LIMITS.get(name, (60, 60.0))
+    raw = os.getenv(f"RATE_LIMIT_{name.upper()}")
+    if raw:
+        try:
+            l, w = raw.split("/", 1)
+            limit, window = int(l), float(w)
+        except ValueError:
+            print(f"⚠️ Ignoring malformed RATE_LIMIT_{name.upper()}={raw!r} (expected '<limit>/<secs>')")
+    return limit, window
+
+
+def get_limiter(name: str) -> RateLimiter:
+    """Return the process-wide limiter for a bucket, creating it on first use."""
+    with _registry_lock:
+        lim = _limiters.get(name)
+        if lim is None:
+            lim = _limiters[name] = RateLimiter(*_limits_for(name))
+        return lim
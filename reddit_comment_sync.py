@@ -9,10 +9,9 @@ Reddit → Lemmy Comment Mirror (Selective, Safe Two-Way, Media Complete)
 import os
 import time
 import praw
-import requests
 
 from db_cache import DB
-from utils import get_valid_token, log, log_error
+from utils import LEMMY_SESSION, get_valid_token, log, log_error
 from auto_backfill import is_first_run, mark_backfill_complete
 from mirror_media import find_urls, mirror_url
 
@@ -22,6 +21,9 @@ DATA_DIR = os.getenv("DATA_DIR", "/opt/Reddit-Mirror-2-Lemmy/data")
 SYNC_INTERVAL_SECS = int(os.getenv("REDDIT_COMMENT_SYNC_INTERVAL", "600"))  # 10 minutes default
 REDDIT_BOT_USERNAME = os.getenv("REDDIT_BOT_USERNAME", "").lower()
 
+_DELETED_BODIES = frozenset(("[deleted]", "[removed]"))
+_VIDEO_EXTS = (".mp4", ".webm", ".mov")
+
 def create_reddit_client():
     return praw.Reddit(
         client_id=os.getenv("REDDIT_CLIENT_ID"),
@@ -41,7 +43,7 @@ def format_reddit_comment_body(comment):
     author_line = f"**u/{name}:**" if name else "**u/[deleted]:**"
 
     body = (getattr(comment, "body", "") or "").strip()
-    if not body or body in ("[deleted]", "[removed]"):
+    if not body or body in _DELETED_BODIES:
         return None
 
     # Extract & mirror media using your updated mirror_media engine
@@ -73,7 +75,7 @@ def format_reddit_comment_body(comment):
                     continue
 
                 low = m.lower()
-                if any(low.endswith(ext) for ext in (".mp4", ".webm", ".mov")):
+                if low.endswith(_VIDEO_EXTS):
                     parts.append(f"- [Video]({m})")
                 else:
                     parts.append(f"- ![Image]({m})")
@@ -156,12 +158,14 @@ def mirror_new_reddit_replies(force_backfill=False):
 
                 payload = {"content": formatted, "post_id": int(lemmy_post_id)}
                 parent_lemmy_id = None
+                parent_reddit_id = None
+                kind = parent_id[:3]
 
-                if parent_id.startswith("t3_"):  # reply to post
+                if kind == "t3_":  # reply to post
                     if not db.get_lemmy_post_id(reddit_post_id):
                         continue
-                elif parent_id.startswith("t1_"):  # reply to comment
-                    parent_reddit_id = parent_id.split("_", 1)[1]
+                elif kind == "t1_":  # reply to comment
+                    parent_reddit_id = parent_id[3:]
                     parent_lemmy_id = db.get_lemmy_comment_id(parent_reddit_id)
                     if not parent_lemmy_id:
                         continue
@@ -170,7 +174,7 @@ def mirror_new_reddit_replies(force_backfill=False):
                     continue
 
                 try:
-                    r = requests.post(
+                    r = LEMMY_SESSION.post(
                         f"{LEMMY_URL}/api/v3/comment",
                         json=payload,
                         headers=headers,
@@ -184,7 +188,7 @@ def mirror_new_reddit_replies(force_backfill=False):
                             password=os.getenv("LEMMY_COMMENT_PASS", os.getenv("LEMMY_PASS")),
                         )
                         headers = {"Authorization": f"Bearer {jwt}"}
-                        r = requests.post(
+                        r = LEMMY_SESSION.post(
                             f"{LEMMY_URL}/api/v3/comment",
                             json=payload,
                             headers=headers,
@@ -200,7 +204,7 @@ def mirror_new_reddit_replies(force_backfill=False):
                             password=os.getenv("LEMMY_COMMENT_PASS", os.getenv("LEMMY_PASS")),
                         )
                         headers = {"Authorization": f"Bearer {jwt}"}
-                        r = requests.post(
+                        r = LEMMY_SESSION.post(
                             f"{LEMMY_URL}/api/v3/comment",
                             json=payload,
                             headers=headers,
@@ -222,7 +226,7 @@ def mirror_new_reddit_replies(force_backfill=False):
                     db.save_comment(
                         reddit_id=reddit_comment_id,
                         lemmy_id=str(lemmy_comment_id),
-                        parent_reddit_id=parent_id.split("_", 1)[1] if parent_id.startswith("t1_") else None,
+                        parent_reddit_id=parent_reddit_id,
                         parent_lemmy_id=str(parent_lemmy_id) if parent_lemmy_id else None,
                         source="reddit",
                     )
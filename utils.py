@@ -1,6 +1,8 @@
 import os
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import traceback
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
@@ -8,6 +10,11 @@ from pathlib import Path
 import psutil
 import time
 
+try:
+    import orjson  # optional: faster token/status file (de)serialization
+except ImportError:
+    orjson = None
+
 # ───────────────────────────────
 # Environment Setup
 # ───────────────────────────────
@@ -17,6 +24,32 @@ LEMMY_URL = os.getenv("LEMMY_URL")
 LEMMY_USER = os.getenv("LEMMY_USER")
 LEMMY_PASS = os.getenv("LEMMY_PASS")
 
+# ───────────────────────────────
+# Shared HTTP Sessions
+# ───────────────────────────────
+def pooled_adapter(retries: int = 3, pool_maxsize: int = 32) -> HTTPAdapter:
+    """
+    Keep-alive connection pool that retries transient 502/503/504 gateway errors.
+    urllib3 only retries idempotent methods by default, so a POST is never replayed.
+    """
+    return HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(total=retries, backoff_factor=0.5, status_forcelist=[502, 503, 504]),
+    )
+
+def pooled_session(retries: int = 3, pool_maxsize: int = 32) -> requests.Session:
+    """requests.Session with one pooled_adapter() mounted for http and https."""
+    s = requests.Session()
+    adapter = pooled_adapter(retries, pool_maxsize)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+# One keep-alive pool for every Lemmy call made here and by the sync scripts.
+# Auth stays per call because the scripts log in as different users.
+LEMMY_SESSION = pooled_session()
+
 # ───────────────────────────────
 # Directory & Lock Setup
 # ───────────────────────────────
@@ -31,6 +64,24 @@ LOG_DIR.mkdir(parents=True, exist_ok=True)
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 
+def read_json(path: Path):
+    """Parse a JSON file from bytes (orjson when installed)."""
+    data = Path(path).read_bytes()
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def write_json(path: Path, obj) -> None:
+    """Pretty-printed JSON via tmp file + rename, so readers never see a torn file."""
+    path = Path(path)
+    if orjson is not None:
+        payload = orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    else:
+        payload = json.dumps(obj, indent=2).encode("utf-8")
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, path)
+
+
 def acquire_token_lock(timeout=90):
     """
     Prevent concurrent Lemmy logins across multiple processes.
@@ -63,7 +114,7 @@ def write_status(mirror_status="running", posts=0, comments=0):
             "uptime": uptime,
         }
 
-        status_file.write_text(json.dumps(data, indent=2))
+        write_json(status_file, data)
     except Exception as e:
         log_error("write_status", e)
 
@@ -118,7 +169,7 @@ def get_valid_token(username: str = None, password: str = None, force: bool = Fa
 
     try:
         if not force and token_file.exists():
-            data = json.loads(token_file.read_text())
+            data = read_json(token_file)
             jwt = data.get("jwt")
             expiry = data.get("expires")
 
@@ -133,7 +184,7 @@ def get_valid_token(username: str = None, password: str = None, force: bool = Fa
                     print("🕒 Token recently expired — waiting for another process to refresh it.")
                     time.sleep(5)
                     try:
-                        data = json.loads(token_file.read_text())
+                        data = read_json(token_file)
                         new_jwt = data.get("jwt")
                         new_expiry = data.get("expires")
                         if new_jwt and new_expiry and datetime.utcnow() < datetime.fromisoformat(new_expiry):
@@ -161,7 +212,7 @@ def refresh_token(username: str = None, password: str = None, token_file: Path =
         # Another process logged in recently — reuse cache if possible
         if token_file.exists():
             try:
-                data = json.loads(token_file.read_text())
+                data = read_json(token_file)
                 jwt = data.get("jwt")
                 expiry = data.get("expires")
                 if jwt and expiry and datetime.utcnow() < datetime.fromisoformat(expiry):
@@ -175,7 +226,7 @@ def refresh_token(username: str = None, password: str = None, token_file: Path =
 
     for attempt in range(1, 6):
         try:
-            r = requests.post(url, json=payload, timeout=30)
+            r = LEMMY_SESSION.post(url, json=payload, timeout=30)
             if r.status_code == 429 or "rate_limit_error" in r.text:
                 wait_time = 15 * attempt
                 print(f"⚠️ Lemmy rate limit hit, waiting {wait_time}s...")
@@ -185,19 +236,17 @@ def refresh_token(username: str = None, password: str = None, token_file: Path =
             if r.status_code != 200:
                 raise RuntimeError(f"Lemmy login failed: {r.status_code} {r.text}")
 
-            data = r.json()
+            data = orjson.loads(r.content) if orjson is not None else r.json()
             jwt = data.get("jwt")
             if not jwt:
                 raise RuntimeError("Lemmy returned no JWT")
 
-            token_file.write_text(
-                json.dumps(
-                    {
-                        "jwt": jwt,
-                        "expires": (datetime.utcnow() + timedelta(hours=4)).isoformat(),
-                    },
-                    indent=2,
-                )
+            write_json(
+                token_file,
+                {
+                    "jwt": jwt,
+                    "expires": (datetime.utcnow() + timedelta(hours=4)).isoformat(),
+                },
             )
             log(f"🔑 Refreshed Lemmy token for {user}")
             return jwt
@@ -215,7 +264,7 @@ def get_community_id(community_name: str, jwt: str) -> int:
     """Return Lemmy community ID by name."""
     url = f"{LEMMY_URL}/api/v3/community"
     try:
-        r = requests.get(
+        r = LEMMY_SESSION.get(
             url,
             params={"name": community_name},
             headers={"Authorization": f"Bearer {jwt}"},
@@ -244,7 +293,7 @@ def create_lemmy_post(subreddit: str, post_data: dict, jwt: str, community_id: i
         body["url"] = post_data["url"]
 
     try:
-        r = requests.post(url, json=body, headers={"Authorization": f"Bearer {jwt}"}, timeout=30)
+        r = LEMMY_SESSION.post(url, json=body, headers={"Authorization": f"Bearer {jwt}"}, timeout=30)
         if r.status_code != 200:
             raise RuntimeError(f"Post creation failed: {r.status_code} {r.text}")
 